@@ -1,12 +1,38 @@
+import time
+
+# Measure the cold start from the very first import, before dash is loaded
+STARTUP_TIME = time.perf_counter()
+
+import argparse
+import os
+import sys
+
 import dash
-from dash import dcc, html
-from dash.dependencies import Input, Output
-import plotly.express as px
+from dash import dcc, html, no_update
+from dash.dependencies import Input, Output, State
 import plotly.graph_objects as go
-import numpy as np
-import pandas as pd
-import os
-import argparse
+# plotly imports numpy lazily on first use, import it up front so a request thread
+# never observes it half-initialized while the background loader imports pandas
+import numpy  # noqa: F401
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from data_store import DataStore
+from jobs import SweepRunner
+
+# Target for the time between the first import and the server binding its port.
+# Data loading and figure construction happen after the server is up, so this does
+# not depend on the size of the dataset.
+COLD_START_TARGET_SECONDS = 1.5
+
+# How often (in milliseconds) the layout polls the store for newly loaded or simulated games
+DATA_POLL_INTERVAL_MS = 1000
+
+# Upper bound on the number of games a single sweep submitted from the dashboard may contain
+MAX_SWEEP_GAMES = 10000
+
+# Populated in `__main__`, read by the callbacks
+store = None
+runner = None
 
 
 # --- Add external stylesheets for refined styling ---
@@ -129,26 +155,72 @@ app.index_string = '''
 </html>
 '''
 
+def style_figure(fig, title):
+    # Shared styling for every figure on the dashboard
+    fig.update_layout(
+        title=title,
+        template='plotly_white',
+        font=dict(family='Inter, sans-serif', size=12, color='#2c3e50'),
+        title_font=dict(size=16, family='Inter, sans-serif', color='#2c3e50'),
+        title_x=0.5,  # Center the title
+        margin=dict(l=40, r=40, t=60, b=40),
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)'
+    )
+    fig.update_xaxes(
+        showgrid=True, gridwidth=1, gridcolor='rgba(0,0,0,0.05)',
+        showline=True, linewidth=1, linecolor='rgba(0,0,0,0.1)'
+    )
+    fig.update_yaxes(
+        showgrid=True, gridwidth=1, gridcolor='rgba(0,0,0,0.05)',
+        showline=True, linewidth=1, linecolor='rgba(0,0,0,0.1)'
+    )
+    return fig
+
+def empty_figure(title):
+    return style_figure(go.Figure(), title)
+
+def create_histogram(convergence_times):
+    # Make a histogram of how long it took for each game to converge
+    fig_hist = go.Figure(go.Histogram(
+        x=convergence_times,
+        nbinsx=50,
+        marker_color="#3498db",
+        hovertemplate="Iterations to Converge: %{x}<br>Number of Games: %{y}<extra></extra>"
+    ))
+    style_figure(fig_hist, "Distribution of Convergence Rates")
+    fig_hist.update_layout(
+        yaxis_title="Number of Games",
+        xaxis_title="Iterations to Converge",
+        bargap=0.1
+    )
+    return fig_hist
+
+def hyperparams_badges(hyperparams):
+    if not hyperparams:
+        return [html.Em("No hyperparameters available in dataset", className="text-muted")]
+    return [
+        html.Span(
+            className="params-badge",
+            children=[
+                html.Span(f"{key}: ", className="params-label"),
+                html.Span(f"{value}", className="params-value")
+            ]
+        ) for key, value in hyperparams.items()
+    ]
+
 # Define function to create layout
-def create_layout(game_ids, fig_hist):
-    # Extract hyperparameters from dataframe if available
-    hyperparams = {}
-    try:
-        if 'seed' in df.columns:
-            hyperparams['Seed'] = df['seed'].iloc[0] if df['seed'].nunique() == 1 else 'Multiple'
-        if 'max_iteration' in df.columns:
-            hyperparams['Max Iterations'] = df['max_iteration'].iloc[0]-1 if df['max_iteration'].nunique() == 1 else 'Multiple'
-        if 'window_size' in df.columns:
-            hyperparams['Window Size'] = df['window_size'].iloc[0] if df['window_size'].nunique() == 1 else 'Multiple'
-        if 'epsilon' in df.columns:
-            hyperparams['Epsilon'] = df['epsilon'].iloc[0] if df['epsilon'].nunique() == 1 else 'Multiple'
-    except:
-        # Handle the case where we can't extract hyperparameters
-        hyperparams = {}
-    
+# The layout only contains placeholders, the data is filled in by `populate_from_store`
+# once the background loader has finished
+def create_layout():
     return html.Div(
         className="main-container",
         children=[
+            # Polls the store for data from the background loader and running sweeps
+            dcc.Interval(id='data-poll', interval=DATA_POLL_INTERVAL_MS),
+            # The store version that is currently drawn, so unchanged data is not re-sent
+            dcc.Store(id='rendered-version', data=None),
+
             # Header Section
             html.Div(
                 className="app-header",
@@ -178,17 +250,67 @@ def create_layout(game_ids, fig_hist):
                                     html.Div(
                                         className="card-body",
                                         children=[
-                                            html.Div([
-                                                html.Span(
-                                                    className="params-badge",
-                                                    children=[
-                                                        html.Span(f"{key}: ", className="params-label"),
-                                                        html.Span(f"{value}", className="params-value")
+                                            html.Div(
+                                                id='hyperparams',
+                                                children=[html.Em("Loading data...", className="text-muted")]
+                                            )
+                                        ]
+                                    )
+                                ]
+                            )
+                        ]
+                    )
+                ]
+            ),
+
+            # Sweep Section
+            html.Div(
+                className="row mb-4",
+                children=[
+                    html.Div(
+                        className="col-12",
+                        children=[
+                            html.Div(
+                                className="card",
+                                children=[
+                                    html.Div(
+                                        className="card-header",
+                                        children=[
+                                            html.I(className="fas fa-play me-2"),
+                                            " Run New Sweep"
+                                        ]
+                                    ),
+                                    html.Div(
+                                        className="card-body",
+                                        children=[
+                                            html.Div(
+                                                className="row",
+                                                children=[
+                                                    html.Div(
+                                                        className="col-md-2 mb-2",
+                                                        children=[
+                                                            html.Label(label, className="params-label d-block"),
+                                                            dcc.Input(id=input_id, type="number", value=value,
+                                                                      min=minimum, step="any", className="form-control")
+                                                        ]
+                                                    ) for label, input_id, value, minimum in [
+                                                        ("Number of Games", "sweep-games", 100, 1),
+                                                        ("Epsilon", "sweep-epsilon", 1e-4, 0),
+                                                        ("Window Size", "sweep-window", 10, 1),
+                                                        ("Max Iterations", "sweep-iterations", 10**4, 1)
                                                     ]
-                                                ) for key, value in hyperparams.items()
-                                            ] if hyperparams else [
-                                                html.Em("No hyperparameters available in dataset", className="text-muted")
-                                            ])
+                                                ] + [
+                                                    html.Div(
+                                                        className="col-md-2 mb-2 d-flex align-items-end",
+                                                        children=[
+                                                            html.Button("Run Sweep", id="sweep-submit", n_clicks=0,
+                                                                        className="btn btn-primary")
+                                                        ]
+                                                    )
+                                                ]
+                                            ),
+                                            html.Div(id="sweep-message", className="text-muted mt-2"),
+                                            html.Ul(id="sweep-status", className="mt-2 mb-0")
                                         ]
                                     )
                                 ]
@@ -221,7 +343,7 @@ def create_layout(game_ids, fig_hist):
                                         children=[
                                             dcc.Graph(
                                                 id='convergence-histogram',
-                                                figure=fig_hist,
+                                                figure=empty_figure("Loading data..."),
                                                 config={'displayModeBar': 'hover'}
                                             )
                                         ]
@@ -255,11 +377,8 @@ def create_layout(game_ids, fig_hist):
                                             html.Div(
                                                 dcc.Dropdown(
                                                     id='game-id-dropdown',
-                                                    options=[
-                                                        {'label': f'Game {gid}', 'value': gid}
-                                                        for gid in game_ids
-                                                    ],
-                                                    value=game_ids[0] if game_ids else None,
+                                                    options=[],
+                                                    value=None,
                                                     clearable=False,
                                                     className="dash-dropdown mb-4"
                                                 )
@@ -279,6 +398,70 @@ def create_layout(game_ids, fig_hist):
         ]
     )
 
+# Fill in the placeholders once the background loader is done, and redraw whenever
+# a running sweep has streamed new games into the store
+@app.callback(
+    Output('convergence-histogram', 'figure'),
+    Output('game-id-dropdown', 'options'),
+    Output('game-id-dropdown', 'value'),
+    Output('hyperparams', 'children'),
+    Output('rendered-version', 'data'),
+    Output('sweep-status', 'children'),
+    Input('data-poll', 'n_intervals'),
+    State('rendered-version', 'data'),
+    State('game-id-dropdown', 'value')
+)
+
+def populate_from_store(_, rendered_version, selected_game_id):
+    """Populates the histogram, dropdown and parameters whenever the store has changed."""
+    sweep_status = [html.Li(line) for line in runner.status()] if runner else []
+    if not store.ready or store.version == rendered_version:
+        return no_update, no_update, no_update, no_update, no_update, sweep_status
+
+    if store.error:
+        error = html.Em(store.error, className="text-danger")
+        return empty_figure("No data available"), [], None, [error], store.version, sweep_status
+
+    # The histogram is built on the first request after a change and cached on the store
+    version = store.version
+    if store.fig_hist_version != version:
+        convergence_times = store.convergence_time_list()
+        if convergence_times:
+            store.fig_hist = create_histogram(convergence_times)
+        else:
+            store.fig_hist = empty_figure("No convergence data available")
+        store.fig_hist_version = version
+
+    game_ids = store.game_ids()
+    options = [{'label': f'Game {gid}', 'value': gid} for gid in game_ids]
+    # Keep the current selection while new games stream in
+    if selected_game_id not in store.game_index:
+        selected_game_id = game_ids[0] if game_ids else None
+    return store.fig_hist, options, selected_game_id, hyperparams_badges(store.hyperparams), version, sweep_status
+
+# Submit a sweep to the background worker pool, the request returns as soon as it is queued
+@app.callback(
+    Output('sweep-message', 'children'),
+    Input('sweep-submit', 'n_clicks'),
+    State('sweep-games', 'value'),
+    State('sweep-epsilon', 'value'),
+    State('sweep-window', 'value'),
+    State('sweep-iterations', 'value'),
+    prevent_initial_call=True
+)
+
+def submit_sweep(_, number_of_games, epsilon, window_size, max_iterations):
+    """Queues a new sweep of fictitious play experiments."""
+    if not store.ready:
+        return "The dataset is still loading, try again in a moment."
+    if None in (number_of_games, epsilon, window_size, max_iterations):
+        return "Fill in all sweep parameters."
+    if not (1 <= number_of_games <= MAX_SWEEP_GAMES) or epsilon <= 0 or window_size < 1 or max_iterations < 1:
+        return f"Invalid sweep parameters (1 to {MAX_SWEEP_GAMES} games, positive epsilon, window size and iterations)."
+
+    sweep = runner.submit(int(number_of_games), float(epsilon), int(window_size), int(max_iterations))
+    return f"Queued sweep {sweep.sweep_id} with {sweep.total} games."
+
 # Define the callback to update the line chart
 @app.callback(
     Output('time-series-chart', 'figure'),
@@ -289,154 +472,78 @@ def update_line_chart(selected_game_id):
     """Updates the line chart based on the selected game_id."""
     if selected_game_id is None:
         # Handle case where no game is selected
-        return px.line(title="Select a Game ID to view its time series")
+        return empty_figure("Select a Game ID to view its time series")
 
-    # Filter the DataFrame for the selected game_id
-    filtered_df = df[df['game_id'] == selected_game_id]
+    # Look up the rows of the selected game_id
+    filtered_df = store.game_frame(selected_game_id)
 
-    if filtered_df.empty:
-        return px.line(title=f"No data found for Game ID {selected_game_id}")
+    if filtered_df is None or filtered_df.empty:
+        return empty_figure(f"No data found for Game ID {selected_game_id}")
 
     # Create the line chart figure for the selected game
     try:
-        # Melt the filtered data
-        df_melted = filtered_df.melt(id_vars=['iteration'],
-                                     value_vars=['rowena_probabilities', 'colin_probabilities'],
-                                     var_name='Player', value_name='Value')
-        # Update the names for the line plot
-        value_map = {'rowena_probabilities' : 'Rowena',
-                     'colin_probabilities' : 'Colin'}
-        df_melted["Player"] = df_melted['Player'].replace(value_map)
-
         # Create a more visually appealing figure
+        # WebGL traces keep long trajectories responsive in the browser
         colors = {"Rowena": "#3498db", "Colin": "#e74c3c"}
-        
-        fig = px.line(
-            df_melted,
-            x='iteration',
-            y='Value',
-            color='Player',
-            title=f'Strategy Evolution for Game {selected_game_id}',
-            labels={'Value': 'Probability', 'iteration': 'Iteration'},
-            color_discrete_map=colors,
-            template='plotly_white'
-        )
+        columns = {"Rowena": "rowena_probabilities", "Colin": "colin_probabilities"}
+
+        fig = go.Figure([
+            go.Scattergl(
+                x=filtered_df['iteration'],
+                y=filtered_df[column],
+                mode='lines',
+                name=player,
+                line=dict(color=colors[player])
+            ) for player, column in columns.items()
+        ])
+        style_figure(fig, f'Strategy Evolution for Game {selected_game_id}')
         fig.update_layout(
-            font=dict(family='Inter, sans-serif', size=12, color='#2c3e50'),
-            title_font=dict(size=16, family='Inter, sans-serif', color='#2c3e50'),
-            title_x=0.5,  # Center the title
             legend=dict(orientation="h", yanchor="bottom", y=1.02, xanchor="right", x=1),
-            margin=dict(l=40, r=40, t=60, b=40),
             hovermode="x unified",
-            plot_bgcolor='rgba(0,0,0,0)',
-            paper_bgcolor='rgba(0,0,0,0)'
-        )
-        
-        fig.update_xaxes(
-            showgrid=True, gridwidth=1, gridcolor='rgba(0,0,0,0.05)',
-            showline=True, linewidth=1, linecolor='rgba(0,0,0,0.1)'
-        )
-        fig.update_yaxes(
-            showgrid=True, gridwidth=1, gridcolor='rgba(0,0,0,0.05)',
-            showline=True, linewidth=1, linecolor='rgba(0,0,0,0.1)'
+            xaxis_title="Iteration",
+            yaxis_title="Probability"
         )
         
         return fig
     except KeyError as e:
         print(f"Error creating line chart for game {selected_game_id}: Missing column {e}")
-        return px.line(title=f"Error: Data missing for Game ID {selected_game_id}")
+        return empty_figure(f"Error: Data missing for Game ID {selected_game_id}")
 
 # Run the App
 if __name__ == '__main__':
     # Parse arguments
     parser = argparse.ArgumentParser(description="Visualize Fictitious Play Data")
-    parser.add_argument("--output_file", type=str, required=True,
-                        help="Path to the CSV file containing the data.")
+    parser.add_argument("--dataset", type=str, default=os.path.join("outputs", "dataset"),
+                        help="Root directory of the partitioned dataset (see src/dataset.py).")
+    parser.add_argument("--sweep", type=str, action="append", default=None,
+                        help="Only show this sweep, can be repeated. Defaults to every sweep in the dataset.")
+    parser.add_argument("--epsilon", type=float, action="append", default=None,
+                        help="Only show sweeps with this epsilon, can be repeated.")
+    parser.add_argument("--window_size", type=int, action="append", default=None,
+                        help="Only show sweeps with this window size, can be repeated.")
+    parser.add_argument("--debug", action="store_true",
+                        help="Run with the Dash debugger and reloader (starts a second interpreter).")
     args = parser.parse_args()
-    output_file = args.output_file
-    
-    # --- Load CSV Experiment Data ---
-    # Try to load the csv file, attempting to default to other CSV files in the output
-    # directory if the provided one cannot be loaded.
-    # Declare df as global so the callback can access it
-    global df 
-    try:
-        # df = pd.read_csv(output_file)
-        df = pd.read_parquet(output_file)
-    except Exception as e:
-        print(f"Error loading or processing CSV file {output_file}:\n{e}")
-        # Try to select another csv file from the output directory
-        output_dir = os.listdir(os.path.join("outputs"))
-        
-        # If no other CSV files are found, then exit
-        if len(output_dir) == 0:
-            exit(1)
-        # Otherwise try to load CSV files from the directory
-        for i in range(len(output_dir)):
-            try: 
-                # df = pd.read_csv(os.path.join("outputs", output_dir[i]))
-                df = pd.read_parquet(os.path.join("outputs", output_dir[i]))
-                print(f"Defaulted to another CSV file in the output directory: {output_dir[i]}")
-            except Exception as e:
-                continue
-        # If none succeed, then exit
-        exit(1) 
-    # --- End Load CSV Experiment Data ---
-
-    # --- Create Histogram Figure ---
-    # Make a histogram of how long it took for each game to converge
-    # Group by game_id and get the last iteration (convergence time)
-    convergence_times = df.groupby("game_id")["iteration"].last()
-
-    # Create the histogram figure with improved style
-    fig_hist = px.histogram(
-        convergence_times,
-        x="iteration",
-        title="Distribution of Convergence Rates",
-        labels={'iteration': 'Iterations to Converge', 'count': 'Number of Games'},
-        nbins=50,
-        template='plotly_white',
-        color_discrete_sequence=["#3498db"]
-    )
-    fig_hist.update_layout(
-        font=dict(family='Inter, sans-serif', size=12, color='#2c3e50'),
-        title_font=dict(size=16, family='Inter, sans-serif', color='#2c3e50'),
-        title_x=0.5,  # Center the title
-        margin=dict(l=40, r=40, t=60, b=40),
-        plot_bgcolor='rgba(0,0,0,0)',
-        paper_bgcolor='rgba(0,0,0,0)',
-        yaxis_title="Number of Games",
-        xaxis_title="Iterations to Converge",
-        bargap=0.1
-    )
-    
-    fig_hist.update_xaxes(
-        showgrid=True, gridwidth=1, gridcolor='rgba(0,0,0,0.05)',
-        showline=True, linewidth=1, linecolor='rgba(0,0,0,0.1)'
-    )
-    fig_hist.update_yaxes(
-        showgrid=True, gridwidth=1, gridcolor='rgba(0,0,0,0.05)',
-        showline=True, linewidth=1, linecolor='rgba(0,0,0,0.1)'
-    )
-    # --- End Create Histogram Figure ---
-
 
-    # --- Get Unique Game IDs for Dropdown ---
-    try:
-        unique_game_ids = sorted(df['game_id'].unique())
-    except KeyError:
-        print("Error: 'game_id' column not found in CSV. Cannot create dropdown.")
-        unique_game_ids = [] # Set empty list if column is missing
-
-    
     # --- Assign Initial Layout ---
-    # Pass unique game IDs and the histogram figure to the layout function
-    app.layout = create_layout(unique_game_ids, fig_hist)
-    # --- End Assign Layout ---
+    app.layout = create_layout()
+
+    # --- Load Parquet Experiment Data ---
+    # Loading happens in a background thread so the server can bind immediately,
+    # the layout polls the store until the data is available. Only the partitions of the
+    # selected sweeps are read.
+    store = DataStore(args.dataset, sweep_ids=args.sweep, epsilon=args.epsilon, window_size=args.window_size)
+    store.start()
 
+    # New sweeps are simulated in a worker pool and added to the dataset as sweeps of their own
+    runner = SweepRunner(store, dataset_dir=args.dataset)
 
     # --- Run the App ---
-    app.run(debug=True)
+    cold_start = time.perf_counter() - STARTUP_TIME
+    print(f"Dashboard started in {cold_start:.2f}s (target {COLD_START_TARGET_SECONDS:.2f}s)")
+    if cold_start > COLD_START_TARGET_SECONDS:
+        print(f"Warning: cold start exceeded the {COLD_START_TARGET_SECONDS:.2f}s target")
+    app.run(debug=args.debug)
 
     # Features I'd like to have:
     # 1. Display a histogram of the number of iterations it takes for games to converge.
@@ -447,4 +554,4 @@ if __name__ == '__main__':
     #   - epsilon.
     # 3. Create a two line of the average convergence rate over time and include the std, make it
     #   a line with shaded regions around it showing how much it deviates from the average. Create
-    #   one such line for each value. 
\ No newline at end of file
+    #   one such line for each value. 
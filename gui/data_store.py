@@ -0,0 +1,173 @@
+""" Experiment data shared by the dashboard callbacks, loaded in a background thread. """
+
+import os
+import sys
+import threading
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from dataset import read_trajectories, read_switches
+
+# Columns the dashboard actually reads. The `game` column holds a nested list per row and is by far
+# the most expensive one to decode, so it is deliberately left out.
+DASHBOARD_COLUMNS = [
+    "iteration", "game_id", "seed", "max_iteration", "epsilon", "window_size",
+    "rowena_probabilities", "colin_probabilities"
+]
+
+# Columns read of the games stored as action switches, whose trajectories are rebuilt when a game is selected
+SWITCH_COLUMNS = [
+    "game_id", "seed", "max_iteration", "epsilon", "window_size", "recorded_iterations",
+    "rowena_first_action", "rowena_switches", "colin_first_action", "colin_switches"
+]
+
+# Hyperparameters shown on the dashboard, mapped to the column they are read from
+HYPERPARAM_COLUMNS = {
+    "Seed": "seed",
+    "Max Iterations": "max_iteration",
+    "Window Size": "window_size",
+    "Epsilon": "epsilon"
+}
+
+
+class DataStore:
+    def __init__(self, dataset_dir, sweep_ids=None, epsilon=None, window_size=None):
+        # Only the partitions matching these filters are read, see `dataset.read_trajectories`
+        self.dataset_dir = dataset_dir
+        self.filters = dict(sweep_ids=sweep_ids, epsilon=epsilon, window_size=window_size)
+        # Frames are kept as separate chunks so that games streamed in by background jobs
+        # can be added without copying everything loaded so far
+        self.chunks = []
+        # Chunks holding one row of action switches per game rather than trajectories, see `switches.py`
+        self._switch_chunks = set()
+        self.game_index = {}
+        self.convergence_times = {}
+        # Up to two distinct values per hyperparameter, enough to tell a single value from 'Multiple'
+        self._hyperparam_values = {key: [] for key in HYPERPARAM_COLUMNS}
+        # Incremented on every change so the dashboard only redraws when something is new
+        self.version = 0
+        # Figures are built lazily by the dashboard on the first request after a change
+        self.fig_hist = None
+        self.fig_hist_version = None
+        self.error = None
+        self.load_seconds = None
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+
+    @property
+    def ready(self):
+        return self._ready.is_set()
+
+    def start(self):
+        # Load in a daemon thread so the server can bind without waiting for the data
+        thread = threading.Thread(target=self.load, name="data-loader", daemon=True)
+        thread.start()
+        return thread
+
+    def wait(self, timeout=None):
+        return self._ready.wait(timeout)
+
+    def load(self):
+        start = time.perf_counter()
+        try:
+            # Games stored as switches are kept compact, their trajectories are only rebuilt in `game_frame`
+            df = read_trajectories(self.dataset_dir, columns=DASHBOARD_COLUMNS, expand_switches=False, **self.filters)
+            switches = read_switches(self.dataset_dir, columns=SWITCH_COLUMNS, **self.filters)
+        except Exception as e:
+            print(f"Error loading dataset {self.dataset_dir}:\n{e}")
+            df = switches = None
+
+        if df is None:
+            self.error = f"Could not load the dataset in {self.dataset_dir}"
+        elif df.empty and switches.empty:
+            self.error = f"No games in {self.dataset_dir} match the selected sweeps, run a new sweep to add some"
+        else:
+            if not df.empty:
+                self.add_frame(df)
+            if not switches.empty:
+                self.add_switches(switches)
+
+        self.load_seconds = time.perf_counter() - start
+        if df is not None:
+            print(f"Loaded {len(df)} rows and {len(switches)} games stored as switches in {self.load_seconds:.2f}s")
+        self._ready.set()
+
+    def add_frame(self, df):
+        """ Add the trajectories of one or more games, safe to call from any thread. """
+        df = df[[column for column in DASHBOARD_COLUMNS if column in df.columns]]
+        if "game_id" not in df.columns:
+            print("Error: 'game_id' column not found in the data. Cannot create dropdown.")
+            return
+
+        # Group by game_id once, the line chart callback then only slices the rows it needs
+        groups = df.groupby("game_id")
+        indices = groups.indices
+        # Group by game_id and get the last iteration (convergence time)
+        last_iterations = groups["iteration"].last()
+
+        with self._lock:
+            chunk = len(self.chunks)
+            self.chunks.append(df)
+            for game_id, game_indices in indices.items():
+                self.game_index[int(game_id)] = (chunk, game_indices)
+            self.convergence_times.update((int(k), int(v)) for k, v in last_iterations.items())
+            self._add_hyperparams(df)
+            self.version += 1
+            # Data arriving from a job means the store is usable even if the initial load failed
+            self.error = None
+
+    def add_switches(self, df):
+        """ Add games stored as action switches, one row per game (see `switches.py`). """
+        df = df[[column for column in SWITCH_COLUMNS if column in df.columns]].reset_index(drop=True)
+        with self._lock:
+            chunk = len(self.chunks)
+            self.chunks.append(df)
+            self._switch_chunks.add(chunk)
+            for row, game_id in enumerate(df["game_id"].tolist()):
+                self.game_index[int(game_id)] = (chunk, [row])
+            # The last recorded iteration, as for trajectories
+            self.convergence_times.update(zip(df["game_id"].astype(int).tolist(),
+                                              (df["recorded_iterations"] - 1).astype(int).tolist()))
+            self._add_hyperparams(df)
+            self.version += 1
+            self.error = None
+
+    def _add_hyperparams(self, df):
+        for key, column in HYPERPARAM_COLUMNS.items():
+            values = self._hyperparam_values[key]
+            if column in df.columns and len(values) < 2:
+                for value in df[column].unique()[:2]:
+                    if value not in values and len(values) < 2:
+                        values.append(value)
+
+    @property
+    def hyperparams(self):
+        hyperparams = {}
+        for key, values in self._hyperparam_values.items():
+            if len(values) == 1:
+                # `max_iteration` is stored as the number of plays, one more than the maximum iteration
+                hyperparams[key] = values[0] - 1 if key == "Max Iterations" else values[0]
+            elif len(values) > 1:
+                hyperparams[key] = 'Multiple'
+        return hyperparams
+
+    def game_ids(self):
+        with self._lock:
+            return sorted(self.game_index)
+
+    def convergence_time_list(self):
+        with self._lock:
+            return list(self.convergence_times.values())
+
+    def game_frame(self, game_id):
+        # Positional lookup into the pre-computed group index instead of scanning the full frame
+        with self._lock:
+            entry = self.game_index.get(game_id)
+        if entry is None:
+            return None
+        chunk, indices = entry
+        if chunk in self._switch_chunks:
+            # Rebuild the selected game's trajectory from its switches
+            from switches import expand_switches
+            return expand_switches(self.chunks[chunk].iloc[indices], DASHBOARD_COLUMNS)
+        return self.chunks[chunk].iloc[indices]
@@ -0,0 +1,141 @@
+""" Background simulation sweeps submitted from the dashboard. """
+
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from dataset import new_sweep_id, register_sweep, write_partition, complete_sweep
+
+# Finished games are written to the dataset in groups of at least this many trajectory rows, so an interrupted sweep
+# only loses the games of its last group and the dashboard never holds more than a group of a sweep in memory
+WRITE_ROWS = 10**5
+
+
+class Sweep:
+    def __init__(self, sweep_id, game_ids, epsilon, window_size, max_iterations):
+        self.sweep_id = sweep_id
+        self.game_ids = game_ids
+        self.epsilon = epsilon
+        self.window_size = window_size
+        self.max_iterations = max_iterations
+        self.completed = 0
+        self.failed = 0
+        self.started = time.time()
+        self.saved = False
+        # Full trajectories (including the `game` column) of the finished games that are not written yet
+        self.pending = []
+        self.pending_rows = 0
+        # Number of the next file written to the sweep's partition, and the number of games written so far
+        self.parts = 0
+        self.written = 0
+
+    @property
+    def total(self):
+        return len(self.game_ids)
+
+    @property
+    def done(self):
+        return self.completed + self.failed == self.total
+
+    def describe(self):
+        state = "finished" if self.done else "running"
+        text = (f"Sweep {self.sweep_id} ({state}): {self.completed}/{self.total} games, "
+                f"epsilon={self.epsilon}, window={self.window_size}, max_iterations={self.max_iterations}")
+        if self.failed:
+            text += f", {self.failed} failed"
+        if self.saved:
+            text += ", saved to the dataset" if not self.failed else ", saved to the dataset as incomplete"
+        elif self.written:
+            text += f", {self.written} saved"
+        return text
+
+
+class SweepRunner:
+    def __init__(self, store, dataset_dir, max_workers=None):
+        self.store = store
+        self.dataset_dir = dataset_dir
+        self.max_workers = max_workers
+        self.sweeps = []
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def submit(self, number_of_games, epsilon, window_size, max_iterations):
+        """ Queue one game per worker task and return immediately, results stream into the store. """
+        # Imported here rather than at the top, it pulls in pandas which the server does not need to start
+        from run_experiments import run_experiment
+        from seeds import new_sweep_seed, game_seeds
+
+        # The worker pool is created on the first sweep, so dashboards that never run one don't pay for it
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+
+        # Select a seed for every experiment, derived from the sweep seed recorded in the catalog
+        sweep_seed = new_sweep_seed()
+        seeds = game_seeds(sweep_seed, number_of_games)
+        # Registering the sweep in the catalog reserves game ids that no other sweep in the dataset uses
+        sweep_id = new_sweep_id()
+        first_game_id = register_sweep(self.dataset_dir, sweep_id, number_of_games, epsilon, window_size,
+                                       max_iterations, source="dashboard", sweep_seed=sweep_seed)
+        game_ids = list(range(first_game_id, first_game_id + number_of_games))
+
+        with self._lock:
+            sweep = Sweep(sweep_id, game_ids, epsilon, window_size, max_iterations)
+            self.sweeps.append(sweep)
+
+        for game_id, seed in zip(game_ids, seeds):
+            future = self._executor.submit(run_experiment, game_id, seed, max_iterations, window_size, epsilon)
+            future.add_done_callback(lambda f, sweep=sweep: self._on_game_done(sweep, f))
+        return sweep
+
+    def status(self):
+        with self._lock:
+            return [sweep.describe() for sweep in self.sweeps]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _on_game_done(self, sweep, future):
+        # Runs on the executor's result thread, never on a Dash request thread
+        try:
+            df = future.result()
+        except Exception as e:
+            print(f"Error in sweep {sweep.sweep_id}: {e}")
+            with self._lock:
+                sweep.failed += 1
+                finished = sweep.done
+        else:
+            self.store.add_frame(df)
+            with self._lock:
+                sweep.pending.append(df)
+                sweep.pending_rows += len(df)
+                sweep.completed += 1
+                finished = sweep.done
+
+        self._write(sweep, finished)
+        if finished:
+            self._save(sweep)
+
+    def _write(self, sweep, finished):
+        # Write the pending games as the next file of the sweep once there are enough of them, or the sweep finished
+        import pandas as pd
+
+        with self._lock:
+            if not sweep.pending or (not finished and sweep.pending_rows < WRITE_ROWS):
+                return
+            frames, part = sweep.pending, sweep.parts
+            sweep.pending, sweep.pending_rows = [], 0
+            sweep.parts += 1
+        write_partition(pd.concat(frames, ignore_index=True), self.dataset_dir, sweep.sweep_id, part=part)
+        with self._lock:
+            sweep.written += len(frames)
+
+    def _save(self, sweep):
+        # A sweep with failed games stays incomplete in the catalog, its missing game ids are never filled in
+        if not sweep.failed:
+            complete_sweep(self.dataset_dir, sweep.sweep_id)
+        with self._lock:
+            sweep.saved = True
@@ -1,24 +1,32 @@
 import os
-import subprocess
+import runpy
+import sys
 
 def main():
     # Define paths
     script_dir = os.path.dirname(os.path.abspath(__file__))
     outputs_dir = os.path.join(script_dir, "outputs")
+    dataset_dir = os.path.join(outputs_dir, "dataset")
     mega_parquet_path = os.path.join(outputs_dir, "mega.parquet")
-     
+
+    # Add the single-file dataset of earlier versions to the partitioned dataset, once
+    sys.path.append(os.path.join(script_dir, "src"))
+    from dataset import CATALOG_FILE, import_parquet
+    if os.path.exists(mega_parquet_path) and not os.path.exists(os.path.join(dataset_dir, CATALOG_FILE)):
+        print(f"Importing {mega_parquet_path} into {dataset_dir}...")
+        import_parquet(mega_parquet_path, dataset_dir)
+
     # Launch the dashboard
+    # Run it in this interpreter rather than spawning a new one, which would pay the
+    # interpreter start-up and import costs a second time
     print("Launching the interactive dashboard...")
     try:
-        subprocess.run([
-            "python", 
-            os.path.join(script_dir, "gui", "app.py"), 
-            "--output_file", mega_parquet_path
-        ])
+        sys.argv = [os.path.join(script_dir, "gui", "app.py"), "--dataset", dataset_dir] + sys.argv[1:]
+        runpy.run_path(sys.argv[0], run_name="__main__")
     except Exception as e:
         print(f"Error launching dashboard: {e}"
               "Try to run the following command:"
-              "python gui/app.py --output_file 'outputs/mega.parquet'")
+              "python gui/app.py --dataset 'outputs/dataset'")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
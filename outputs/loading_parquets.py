@@ -1,22 +1,26 @@
-import pandas as pd
 import os
 import sys
 
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
-from src.arbitrary_games import Game
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'src')))
+from arbitrary_games import Game
+from dataset import DATASET_DIR, read_catalog, read_trajectories
 
 
-# Change `file_path` to point to the desired parquet file
-file_path = os.path.join("HW3", "outputs", "mega.parquet")
-pd_df = pd.read_parquet(file_path)
-# pd_df.shape (n_rows, 8)
+# Change `dataset_dir` to point to the desired dataset
+dataset_dir = DATASET_DIR
+# The sweeps in the dataset, with their parameters and the range of game ids they hold
+print(read_catalog(dataset_dir))
+
+# Only the rows of the requested game are read, narrow the search further with
+# `sweep_ids=`, `epsilon=` or `window_size=` to skip the other partitions entirely
 # Available columns are:
-# 'iteration', 'game_id', 'seed', 'max_iteration', 'epsilon', 
-# 'window_size', 'rowena_probabilities', 'colin_probabilities'
-pd_23 = pd_df[pd_df["game_id"] == 787 ]
+# 'iteration', 'game_id', 'game', 'seed', 'max_iteration', 'rowena_probabilities', 'colin_probabilities',
+# 'status', 'mode', 'distance_to_equilibrium', 'exploitability' and the partition columns
+# 'sweep_id', 'epsilon', 'window_size'
+pd_23 = read_trajectories(dataset_dir, game_ids=787)
 print(pd_23)
 
 seed = int(pd_23["seed"].unique())
 
 game = Game(seed=seed)
-print(game)
\ No newline at end of file
+print(game)
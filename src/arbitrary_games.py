@@ -2,7 +2,6 @@
 
 from collections import OrderedDict
 import random
-from random import randint
 import warnings
 
 class Game:
@@ -58,11 +57,12 @@ class Game:
         ]
 
     def create_game(self):
-        # Set seed
-        random.seed(self.seed)
+        # Draw from the game's own random stream rather than the global one, so games can be created from several
+        # threads at once. It draws the same utilities as seeding the global stream with `self.seed`
+        rng = random.Random(self.seed)
 
         # Generate random utilities
-        a, b, c, d = randint(self.min_util, self.max_util), randint(self.min_util, self.max_util), randint(self.min_util, self.max_util), randint(self.min_util, self.max_util)
+        a, b, c, d = rng.randint(self.min_util, self.max_util), rng.randint(self.min_util, self.max_util), rng.randint(self.min_util, self.max_util), rng.randint(self.min_util, self.max_util)
         
         game = OrderedDict()
         game["player_1"] = OrderedDict([
@@ -0,0 +1,397 @@
+""" Fictitious play on a batch of games at once, with numpy arrays holding one element per game. """
+
+import random
+
+import numpy as np
+import pandas as pd
+
+from arbitrary_games import Game
+from canonical import equivalence_classes, map_back, class_keys
+from convergence import make_criterion
+from fictitious_play import Play, CONVERGED, DID_NOT_CONVERGE, SADDLE_POINT, CANNOT_CONVERGE
+
+# Fictitious play variants:
+#   "classic":     both players simultaneously best respond to the other's empirical mixed strategy, same as `Play`
+#   "alternating": Rowena moves first and Colin best responds to Rowena's updated empirical mixed strategy
+#   "smoothed":    players play the logit response with `temperature` instead of the best response, and the
+#                  counters are updated with the probability it assigns to the first action (smooth fictitious play)
+#   "weighted":    past plays are discounted by `discount` every iteration, so that recent plays weigh more
+MODES = ("classic", "alternating", "smoothed", "weighted")
+
+# Modes in which `BatchPlay(deduplicate=...)` may play one game per class of equivalent games, see `canonical.py`.
+# In the alternating mode the players are not interchangeable, and the logit response depends on the scale of the utilities
+DEDUPLICATION_MODES = {"exact": ("classic", "smoothed", "weighted"), "strategic": ("classic", "weighted")}
+
+# Modes in which the trajectories can be recorded as action switches, see `switches.py`. In the other modes the
+# counters are not whole numbers of plays
+SWITCH_MODES = ("classic", "alternating")
+
+# Trajectories are recorded in blocks of this many iterations, allocated as the play goes on
+BLOCK_SIZE = 4096
+
+
+class BatchPlay:
+    def __init__(self,
+                 max_iterations=1000,
+                 window_size=10,
+                 epsilon=1e-3,
+                 early_termination=True,
+                 stopping_rule="window",
+                 exploitability_threshold=1e-2,
+                 mode="classic",
+                 temperature=1.0,
+                 discount=0.99,
+                 batch_size=256,
+                 progress=None,
+                 deduplicate=None):
+
+        if mode not in MODES:
+            raise ValueError(f"Expected mode to be one of {MODES} but got mode={mode}")
+        if mode == "weighted" and not 0 < discount <= 1:
+            raise ValueError(f"Expected a discount in (0, 1] but got discount={discount}")
+        if mode == "smoothed" and temperature <= 0:
+            raise ValueError(f"Expected a positive temperature but got temperature={temperature}")
+        if deduplicate is not None and mode not in DEDUPLICATION_MODES.get(deduplicate, ()):
+            raise ValueError(f"Expected deduplicate to be None or one of {tuple(DEDUPLICATION_MODES)} with a mode in "
+                             f"{DEDUPLICATION_MODES.get(deduplicate)} but got deduplicate={deduplicate}, mode={mode}")
+
+        # `max_iterations + 1` ensures that we play up to and including the specified maximum
+        self.max_iterations = max_iterations + 1
+        self.W = window_size
+        self.epsilon = epsilon
+        self.early_termination = early_termination
+        self.criterion = make_criterion(stopping_rule, window_size, epsilon, exploitability_threshold)
+        self.mode = mode
+        self.temperature = temperature
+        self.discount = discount if mode == "weighted" else 1.0
+        # Games are played `batch_size` at a time, a batch runs until its slowest game stops
+        self.batch_size = batch_size
+        # Optional `progress.ProgressReporter`, told about every batch of finished games
+        self.progress = progress
+        # `run` plays every class of equivalent games once and maps the results back, see `canonical.py`
+        self.deduplicate = deduplicate
+
+    def run(self, games, game_ids, seeds):
+        """
+        Play every game and return one row per game with its status, the number of plays and the final empirical
+        mixed strategies.
+
+        With `deduplicate`, the rows also hold the `class_key` of every game's class (see `canonical.class_keys`), and
+        every class is only played once.
+        """
+        utilities, first_actions = self._inputs(games, seeds)
+        if self.deduplicate is not None:
+            return self._run_deduplicated(utilities, first_actions, game_ids, seeds)
+
+        frames = []
+        for start in range(0, len(games), self.batch_size):
+            end = start + self.batch_size
+            result = self._play(utilities[start:end], first_actions[start:end], record=False)
+            self._report_done(game_ids[start:end], result)
+            frames.append(self._summary_dataframe(game_ids[start:end], seeds[start:end], result))
+        return pd.concat(frames, ignore_index=True)
+
+    def _run_deduplicated(self, utilities, first_actions, game_ids, seeds):
+        classes, class_first_actions, inverse, transform = equivalence_classes(
+            utilities.astype(np.int64), first_actions, self.deduplicate)
+
+        results = []
+        for start in range(0, len(classes), self.batch_size):
+            end = start + self.batch_size
+            results.append(self._play(classes[start:end].astype(float), class_first_actions[start:end], record=False))
+        result = {key: np.concatenate([batch[key] for batch in results]) for key in ("status", "plays", "rowena_p", "colin_p")}
+
+        # Every game takes the result of its class, with the strategies mapped back through its transform
+        result = {key: values[inverse] for key, values in result.items()}
+        result["rowena_p"], result["colin_p"] = map_back(result["rowena_p"], result["colin_p"], transform)
+        self._report_done(game_ids, result)
+
+        df = self._summary_dataframe(game_ids, seeds, result)
+        df["class_key"] = np.array(class_keys(classes, class_first_actions), dtype=object)[inverse]
+        return df
+
+    def _summary_dataframe(self, game_ids, seeds, result):
+        return pd.DataFrame({
+            'game_id': game_ids,
+            'seed': seeds,
+            'mode': self.mode,
+            'status': result["status"],
+            'iterations': result["plays"],
+            'rowena_probability': result["rowena_p"],
+            'colin_probability': result["colin_p"]
+        })
+
+    def simulate_trajectories(self, games, game_ids, seeds):
+        """ Play every game and return the empirical mixed strategies of every iteration, in the format of `Play`. """
+        frames = [self.trajectory_dataframe(games[start:end], game_ids[start:end], seeds[start:end], result)
+                  for start, end, result in self.simulate_batches(games, game_ids, seeds)]
+        return pd.concat(frames, ignore_index=True)
+
+    def simulate_switches(self, games, game_ids, seeds):
+        """ Play every game and return one row per game with the iterations at which the players switch actions. """
+        frames = [self.switches_dataframe(games[start:end], game_ids[start:end], seeds[start:end], result)
+                  for start, end, result in self.simulate_batches(games, game_ids, seeds, record="switches")]
+        return pd.concat(frames, ignore_index=True)
+
+    def simulate_batches(self, games, game_ids, seeds, batch_size=None, record=True):
+        """
+        Play the games `batch_size` (by default `self.batch_size`) at a time, recording their trajectories.
+
+            Yields (start, end, result) per batch, where `result` holds the recorded trajectories of games[start:end],
+            see `trajectory_dataframe`. Only one batch is simulated at a time, the next one when the caller asks for it.
+            With `record="switches"` only the iterations at which the players switch actions are recorded, see
+            `switches_dataframe`, which takes memory independent of the number of iterations.
+        """
+        if record == "switches" and self.mode not in SWITCH_MODES:
+            raise ValueError(f"Expected a mode in {SWITCH_MODES} to record switches but got mode={self.mode}")
+        batch_size = batch_size or self.batch_size
+        utilities, first_actions = self._inputs(games, seeds)
+        for start in range(0, len(games), batch_size):
+            end = min(start + batch_size, len(games))
+            result = self._play(utilities[start:end], first_actions[start:end], record=record)
+            self._report_done(game_ids[start:end], result)
+            yield start, end, result
+            # Don't hold on to the batch while the next one is played
+            result = None
+
+    def _inputs(self, games, seeds):
+        # Rowena's utilities (a, b, c, d) as an (n, 4) array and both players' first actions as an (n, 2) array
+        n = len(games)
+        utilities = np.array([list(game.game["player_1"].values()) for game in games]).reshape(n, 4)
+        # Drawn exactly as in `Play`, so both engines start every game from the same actions
+        first_actions = np.array([Play.first_actions(seed) for seed in seeds], dtype=int).reshape(n, 2)
+        return utilities, first_actions
+
+    @staticmethod
+    def saddle_points(a, b, c, d):
+        """ Vectorized `Play.saddle_point`: a mask of the games with a strict saddle point and its (row, column) actions. """
+        utilities = [[a, b], [c, d]]
+        has_saddle = np.zeros(len(a), dtype=bool)
+        rows = np.zeros(len(a), dtype=int)
+        columns = np.zeros(len(a), dtype=int)
+        # Iterate in the same order as `Play.saddle_point`, keeping the first saddle point found
+        for i in (0, 1):
+            for j in (0, 1):
+                found = (utilities[i][j] > utilities[1-i][j]) & (utilities[i][j] < utilities[i][1-j]) & ~has_saddle
+                rows[found] = i
+                columns[found] = j
+                has_saddle |= found
+        return has_saddle, rows, columns
+
+    def _report_done(self, game_ids, result):
+        if self.progress is not None:
+            self.progress.games_done(game_ids, result["status"], result["plays"])
+
+    def _response(self, first_action_utility, second_action_utility):
+        # Probability of playing the first action
+        if self.mode == "smoothed":
+            # The logistic function written with tanh, which does not overflow
+            return 0.5 * (1 + np.tanh((first_action_utility - second_action_utility) / (2 * self.temperature)))
+        # If the two utilities are identical, deterministically choose the first action, as in `Play.best_response`
+        return (first_action_utility >= second_action_utility).astype(float)
+
+    def _play(self, utilities, first_actions, record):
+        # `record` is False, True (every empirical mixed strategy) or "switches" (the iterations of action switches)
+        n = len(utilities)
+        utilities = np.asarray(utilities, dtype=float)
+        a, b, c, d = (utilities[:, k].copy() for k in range(4))
+        # Colin's utilities, negated once up front so the expected utilities are computed exactly as in `Play`
+        neg_a, neg_b, neg_c, neg_d = -a, -b, -c, -d
+
+        # Count how often each player played their first action, weighted by `discount` in the weighted mode.
+        # `total` is the (weighted) number of plays, the same for every game
+        rowena_count = (first_actions[:, 0] == 0).astype(float)
+        colin_count = (first_actions[:, 1] == 0).astype(float)
+        total = 1.0
+        discount = self.discount
+
+        status = np.full(n, DID_NOT_CONVERGE, dtype=object)
+        plays = np.full(n, self.max_iterations)
+        rowena_final = np.zeros(n)
+        colin_final = np.zeros(n)
+        done = np.zeros(n, dtype=bool)
+
+        # Only plain fictitious play provably converges to a strict saddle point and has the
+        # step size bound behind `cannot_converge`
+        uniform = self.mode in ("classic", "alternating")
+        if self.early_termination and uniform:
+            has_saddle, saddle_rows, saddle_columns = self.saddle_points(a, b, c, d)
+            status[has_saddle] = SADDLE_POINT
+            plays[has_saddle] = 0
+            rowena_final[has_saddle] = (saddle_rows[has_saddle] == 0)
+            colin_final[has_saddle] = (saddle_columns[has_saddle] == 0)
+            done |= has_saddle
+
+        rowena_p = rowena_count / total
+        colin_p = colin_count / total
+        criterion = self.criterion
+        criterion.reset((a, b, c, d), rowena_p, colin_p, maximum=np.maximum, minimum=np.minimum)
+
+        blocks = []
+        if record == "switches":
+            # The actions of the previous iteration, and the (iteration, game) pairs of every switch per player
+            previous_actions = [first_actions[:, 0].astype(int), first_actions[:, 1].astype(int)]
+            switches = [([], []), ([], [])]
+        elif record:
+            blocks.append(np.empty((BLOCK_SIZE, 2, n)))
+            blocks[0][0, 0] = rowena_p
+            blocks[0][0, 1] = colin_p
+
+        if self.early_termination and uniform and criterion.can_prove_non_convergence(self.max_iterations):
+            next_bound_check = self.W
+        else:
+            next_bound_check = self.max_iterations
+
+        i = 0
+        for i in range(1, self.max_iterations):
+            if done.all():
+                break
+
+            # Rowena best responds to Colin's latest empirical mixed strategy
+            rowena_x = self._response(a * colin_p + b * (1 - colin_p), c * colin_p + d * (1 - colin_p))
+            if self.mode == "alternating":
+                # Colin sees Rowena's move of this iteration before responding
+                rowena_count = discount * rowena_count + rowena_x
+                rowena_p = rowena_count / (discount * total + 1)
+            colin_x = self._response(neg_a * rowena_p + neg_c * (1 - rowena_p), neg_b * rowena_p + neg_d * (1 - rowena_p))
+
+            if self.mode != "alternating":
+                rowena_count = discount * rowena_count + rowena_x
+            colin_count = discount * colin_count + colin_x
+            total = discount * total + 1
+            rowena_p = rowena_count / total
+            colin_p = colin_count / total
+
+            rowena_action, colin_action = (rowena_x < 0.5).astype(int), (colin_x < 0.5).astype(int)
+            if record == "switches":
+                for player, action in enumerate((rowena_action, colin_action)):
+                    switched = np.flatnonzero(action != previous_actions[player])
+                    if len(switched):
+                        switches[player][0].append(np.full(len(switched), i))
+                        switches[player][1].append(switched)
+                    previous_actions[player] = action
+            elif record:
+                block, row = divmod(i, BLOCK_SIZE)
+                if block == len(blocks):
+                    blocks.append(np.empty((BLOCK_SIZE, 2, n)))
+                blocks[block][row, 0] = rowena_p
+                blocks[block][row, 1] = colin_p
+
+            # Check if convergence criteria is met, games that already stopped keep playing but are ignored
+            converged = criterion.update(i, rowena_p, colin_p, rowena_action, colin_action)
+            newly_converged = converged & ~done
+            if newly_converged.any():
+                status[newly_converged] = CONVERGED
+                plays[newly_converged] = i + 1
+                rowena_final[newly_converged] = rowena_p[newly_converged]
+                colin_final[newly_converged] = colin_p[newly_converged]
+                done |= newly_converged
+
+            # Stop games whose remaining iterations provably cannot meet the convergence criteria
+            if i == next_bound_check:
+                next_bound_check += self.W
+                cannot = criterion.cannot_converge(i + 1, rowena_count, colin_count, self.max_iterations) & ~done
+                if cannot.any():
+                    status[cannot] = CANNOT_CONVERGE
+                    plays[cannot] = i + 1
+                    rowena_final[cannot] = rowena_p[cannot]
+                    colin_final[cannot] = colin_p[cannot]
+                    done |= cannot
+
+        # Games still running reached the maximum number of iterations
+        rowena_final[~done] = rowena_p[~done]
+        colin_final[~done] = colin_p[~done]
+
+        result = {"status": status, "plays": plays, "rowena_p": rowena_final, "colin_p": colin_final}
+        if record == "switches":
+            result["first_actions"] = first_actions
+            result["switches"] = [self._split_switches(iterations, games, plays) for iterations, games in switches]
+        elif record:
+            # (iterations, 2, games), trimmed to the iterations that were actually played
+            result["trajectories"] = np.concatenate(blocks)[:i + 1]
+        return result
+
+    @staticmethod
+    def _split_switches(iterations, games, plays):
+        # The (iteration, game) pairs of one player's switches as one array of iterations per game, leaving out
+        # the switches of games that kept playing after they stopped
+        n = len(plays)
+        iterations = np.concatenate(iterations) if iterations else np.zeros(0, dtype=int)
+        games = np.concatenate(games) if games else np.zeros(0, dtype=int)
+        played = iterations < plays[games]
+        iterations, games = iterations[played], games[played]
+        # The pairs are in order of iteration, a stable sort by game keeps them in that order within every game
+        order = np.argsort(games, kind="stable")
+        return np.split(iterations[order].astype(np.int32), np.cumsum(np.bincount(games, minlength=n))[:-1])
+
+    def switches_dataframe(self, games, game_ids, seeds, result):
+        """ The switches of one batch of `simulate_batches(record="switches")` as a DataFrame, see `switches.py`. """
+        saddle = result["status"] == SADDLE_POINT
+        first_actions = result["first_actions"]
+        # A saddle point is stored as one iteration of the saddle point's actions, as its trajectory holds the limit
+        rowena_first_action = np.where(saddle, (result["rowena_p"] == 0).astype(int), first_actions[:, 0])
+        colin_first_action = np.where(saddle, (result["colin_p"] == 0).astype(int), first_actions[:, 1])
+        return pd.DataFrame({
+            'game_id': game_ids,
+            'game': [game.to_list() for game in games],
+            'seed': seeds,
+            'max_iteration': self.max_iterations,
+            'epsilon': self.epsilon,
+            'window_size': self.W,
+            'status': result["status"],
+            'mode': self.mode,
+            'recorded_iterations': np.where(saddle, 1, result["plays"]),
+            'rowena_first_action': rowena_first_action.astype(np.int8),
+            'colin_first_action': colin_first_action.astype(np.int8),
+            'rowena_switches': result["switches"][0],
+            'colin_switches': result["switches"][1],
+            'rowena_probability': result["rowena_p"],
+            'colin_probability': result["colin_p"]
+        })
+
+    def trajectory_dataframe(self, games, game_ids, seeds, result):
+        """ The trajectories of one batch of `simulate_batches` as a DataFrame, in the format of `Play`. """
+        trajectories = result["trajectories"]
+        lengths = []
+        rowena_list = []
+        colin_list = []
+        for g in range(len(games)):
+            if result["status"][g] == SADDLE_POINT:
+                # The limit is recorded as the only iteration, as in `Play`
+                rowena_list.append(result["rowena_p"][g:g+1])
+                colin_list.append(result["colin_p"][g:g+1])
+                lengths.append(1)
+            else:
+                plays = result["plays"][g]
+                rowena_list.append(trajectories[:plays, 0, g])
+                colin_list.append(trajectories[:plays, 1, g])
+                lengths.append(plays)
+
+        lengths = np.array(lengths)
+        game_lists = [game.to_list() for game in games]
+        return pd.DataFrame({
+            'iteration': np.concatenate([np.arange(length) for length in lengths]),
+            'game_id': np.repeat(game_ids, lengths),
+            'game': [game_list for game_list, length in zip(game_lists, lengths) for _ in range(length)],
+            'seed': np.repeat(seeds, lengths),
+            'max_iteration': self.max_iterations,
+            'epsilon': self.epsilon,
+            'window_size': self.W,
+            'rowena_probabilities': np.concatenate(rowena_list),
+            'colin_probabilities': np.concatenate(colin_list),
+            'status': np.repeat(result["status"], lengths),
+            'mode': self.mode
+        })
+
+
+# Example usage, comparing the fictitious play variants on the same games:
+if __name__ == "__main__":
+    number_of_games = 200
+    seeds = random.sample(range(10**9), number_of_games)
+    games = [Game(seed=seed) for seed in seeds]
+
+    for mode in MODES:
+        batch_play = BatchPlay(max_iterations=10**4, epsilon=1e-4, mode=mode)
+        summary = batch_play.run(games, list(range(number_of_games)), seeds)
+        print(f"{mode:>12}: {summary['status'].value_counts().to_dict()}, "
+              f"median iterations {summary['iterations'].median():.0f}")
@@ -0,0 +1,147 @@
+""" Canonical forms of 2x2 zero-sum games, to simulate every class of equivalent games only once. """
+
+import numpy as np
+
+# Transformations of Rowena's utilities (a, b, c, d), i.e. of the matrix [[a, b], [c, d]]:
+#   player swap:   (-a, -c, -b, -d)    Rowena and Colin trade places, Rowena's new utilities are the negated transpose
+#   row swap:      ( c,  d,  a,  b)    Rowena's actions are relabeled
+#   column swap:   ( b,  a,  d,  c)    Colin's actions are relabeled
+#   affine:        (u - shift) / scale  with scale > 0
+# A transform applies them in this order. Fictitious play on the transformed game, started from the transformed
+# first actions, plays the transformed actions of the original game (see `transform_first_actions`).
+#
+# Which transformations may be used depends on how exact the equivalence has to be:
+#   "exact":      player swap only. `Play` computes both players' expected utilities with the same floating point
+#                 operations, so swapping the players gives bit-identical plays.
+#   "strategic":  every transformation above. These leave the game strategically identical, but the floating point
+#                 operations of the expected utilities change, and a player who is exactly indifferent plays their
+#                 first action, which a row or column swap relabels. Games whose empirical mixed strategies hit or
+#                 graze a point of indifference (common with small utility ranges) can therefore play differently
+#                 from their canonical representative.
+SYMMETRIES = ("exact", "strategic")
+
+
+def _player_swap(u):
+    return np.stack([-u[:, 0], -u[:, 2], -u[:, 1], -u[:, 3]], axis=1)
+
+
+def _row_swap(u):
+    return u[:, [2, 3, 0, 1]]
+
+
+def _column_swap(u):
+    return u[:, [1, 0, 3, 2]]
+
+
+def _normalize(u):
+    # Shift the smallest utility to 0 and divide by the greatest common divisor, the zero game is left as is
+    shift = u.min(axis=1)
+    shifted = u - shift[:, None]
+    scale = np.gcd.reduce(shifted, axis=1)
+    scale[scale == 0] = 1
+    return shifted // scale[:, None], shift, scale
+
+
+def _lexicographically_smaller(x, y):
+    # Row-wise comparison of two (n, 4) arrays, a row is smaller at its first differing element
+    differs = x != y
+    first = np.argmax(differs, axis=1)
+    rows = np.arange(len(x))
+    return differs.any(axis=1) & (x[rows, first] < y[rows, first])
+
+
+def canonicalize(utilities, symmetries="exact"):
+    """
+    Map games, given as an (n, 4) integer array of Rowena's utilities (a, b, c, d), to their canonical form.
+
+        The canonical form is the lexicographically smallest game that the allowed transformations (see `SYMMETRIES`)
+        turn the game into. Ties between transformations (games that are their own transform) go to the one
+        enumerated first, the identity first of all.
+
+    Returns the (n, 4) array of canonical games and the transforms as a dict of arrays with keys `player_swap`,
+    `row_swap`, `column_swap` (booleans), `shift` and `scale`, such that transforming each game gives its canonical form.
+    """
+    if symmetries not in SYMMETRIES:
+        raise ValueError(f"Expected symmetries to be one of {SYMMETRIES} but got symmetries={symmetries}")
+    utilities = np.asarray(utilities)
+    if not np.issubdtype(utilities.dtype, np.integer):
+        raise ValueError(f"Expected integer utilities but got dtype={utilities.dtype}")
+    utilities = utilities.reshape(-1, 4).astype(np.int64)
+    n = len(utilities)
+
+    best = None
+    transform = {key: np.zeros(n, dtype=bool) for key in ("player_swap", "row_swap", "column_swap")}
+    transform["shift"] = np.zeros(n, dtype=np.int64)
+    transform["scale"] = np.ones(n, dtype=np.int64)
+
+    swaps = (False, True) if symmetries == "strategic" else (False,)
+    for player_swap in (False, True):
+        for row_swap in swaps:
+            for column_swap in swaps:
+                candidate = _player_swap(utilities) if player_swap else utilities
+                candidate = _row_swap(candidate) if row_swap else candidate
+                candidate = _column_swap(candidate) if column_swap else candidate
+                if symmetries == "strategic":
+                    candidate, shift, scale = _normalize(candidate)
+                else:
+                    shift, scale = np.zeros(n, dtype=np.int64), np.ones(n, dtype=np.int64)
+
+                better = np.ones(n, dtype=bool) if best is None else _lexicographically_smaller(candidate, best)
+                best = candidate.copy() if best is None else np.where(better[:, None], candidate, best)
+                for key, value in (("player_swap", player_swap), ("row_swap", row_swap),
+                                   ("column_swap", column_swap), ("shift", shift), ("scale", scale)):
+                    transform[key] = np.where(better, value, transform[key])
+    return best, transform
+
+
+def transform_first_actions(rowena_action, colin_action, transform):
+    """ The first actions (0 or 1) of the transformed game that correspond to the given first actions. """
+    rowena_action, colin_action = np.asarray(rowena_action), np.asarray(colin_action)
+    # After a player swap Rowena plays Colin's part
+    rowena_action, colin_action = (np.where(transform["player_swap"], colin_action, rowena_action),
+                                   np.where(transform["player_swap"], rowena_action, colin_action))
+    rowena_action = np.where(transform["row_swap"], 1 - rowena_action, rowena_action)
+    colin_action = np.where(transform["column_swap"], 1 - colin_action, colin_action)
+    return rowena_action, colin_action
+
+
+def map_back(rowena_p, colin_p, transform):
+    """ Map empirical mixed strategies of the transformed game back to the original game, undoing the transform. """
+    rowena_p, colin_p = np.asarray(rowena_p, dtype=float), np.asarray(colin_p, dtype=float)
+    colin_p = np.where(transform["column_swap"], 1 - colin_p, colin_p)
+    rowena_p = np.where(transform["row_swap"], 1 - rowena_p, rowena_p)
+    return (np.where(transform["player_swap"], colin_p, rowena_p),
+            np.where(transform["player_swap"], rowena_p, colin_p))
+
+
+def equivalence_classes(utilities, first_actions, symmetries="exact"):
+    """
+    Group plays, given by games and first actions, into classes of plays with the same outcome.
+
+        `first_actions` is an (n, 2) array of Rowena's and Colin's first actions. A class is a canonical game together
+        with canonical first actions.
+
+    Returns the (m, 4) canonical games and (m, 2) first actions of the m classes, the class of every play and the
+    transform of every play, see `canonicalize`.
+    """
+    canonical, transform = canonicalize(utilities, symmetries)
+    first_actions = np.asarray(first_actions).reshape(-1, 2)
+    rowena_action, colin_action = transform_first_actions(first_actions[:, 0], first_actions[:, 1], transform)
+    keys = np.column_stack([canonical, rowena_action, colin_action])
+    classes, inverse = np.unique(keys, axis=0, return_inverse=True)
+    return classes[:, :4], classes[:, 4:], inverse.reshape(-1), transform
+
+
+def class_keys(canonical, first_actions):
+    """ A string key per class, e.g. '0,3,5,9|1,0', to index results across sweeps. """
+    return [f"{','.join(map(str, game))}|{','.join(map(str, actions))}"
+            for game, actions in zip(np.asarray(canonical).tolist(), np.asarray(first_actions).tolist())]
+
+
+# Example usage, counting the classes of all games with utilities in [-3, 3]:
+if __name__ == "__main__":
+    values = np.arange(-3, 4)
+    games = np.stack(np.meshgrid(values, values, values, values, indexing="ij"), axis=-1).reshape(-1, 4)
+    for symmetries in SYMMETRIES:
+        canonical, _ = canonicalize(games, symmetries)
+        print(f"{symmetries:>9}: {len(games)} games, {len(np.unique(canonical, axis=0))} canonical games")
@@ -0,0 +1,349 @@
+""" Convergence criteria that decide when a fictitious play has converged. """
+
+from collections import deque
+
+from equilibrium import exploitability
+
+# Single games with windows up to this size are checked by scanning the whole window, see `WindowedRange`
+SCAN_WINDOW_SIZE = 16
+
+
+class ConvergenceCriterion:
+    """
+    Base class of the stopping rules used by `Play`.
+
+        A criterion is reset with the game and the first empirical mixed strategies, and then updated once per
+        iteration with the latest empirical mixed strategies and best responses. `update` returns whether the
+        criterion is met. Every criterion does O(1) amortized work per update.
+
+        The same criterion works for a single game, with floats, and for a batch of games played in lockstep, with
+        numpy arrays holding one element per game. For the latter, pass `maximum=np.maximum, minimum=np.minimum` to
+        `reset`; `update` then returns a boolean array (or `False` while no game can have converged yet).
+    """
+
+    def reset(self, utilities, rowena_p, colin_p, maximum=max, minimum=min):
+        # `utilities` are Rowena's utilities (a, b, c, d) of the game being played
+        self.utilities = utilities
+        self.maximum = maximum
+        self.minimum = minimum
+
+    def update(self, i, rowena_p, colin_p, rowena_action, colin_action):
+        # `i` is the iteration, the empirical mixed strategies are over the first `i+1` plays
+        raise NotImplementedError
+
+    def can_prove_non_convergence(self, max_plays):
+        """ Whether `cannot_converge` can ever return True for a run of at most `max_plays` plays. """
+        return False
+
+    def cannot_converge(self, plays, rowena_count, colin_count, max_plays):
+        """ Whether the criterion provably cannot be met before `max_plays`, given each player's first-action count. """
+        return False
+
+
+class WindowedRange(ConvergenceCriterion):
+    """
+    Met once the last `window_size` empirical mixed strategies of both players lie within less than `epsilon`.
+
+        This is the classic rule. Only checked once more than `window_size` iterations have been played, otherwise the
+        game trivially converges while the window contains a single element. The range of the window is maintained
+        with the van Herk/Gil-Werman algorithm: the window always spans the end of the previous block of
+        `window_size` values and the start of the current one, so its maximum is the maximum of a suffix of the previous
+        block (computed once per block) and the running maximum of the current block.
+
+        A single game (floats) runs the same bookkeeping with comparisons instead of calls to `maximum` and `minimum`,
+        and windows of at most `SCAN_WINDOW_SIZE` values are scanned whole from a deque, as `max` and `min` over a
+        short deque in C are cheaper than any bookkeeping in Python.
+    """
+
+    def __init__(self, window_size, epsilon):
+        self.W = window_size
+        self.epsilon = epsilon
+
+    def reset(self, utilities, rowena_p, colin_p, maximum=max, minimum=min):
+        super().reset(utilities, rowena_p, colin_p, maximum, minimum)
+        # `update` is picked per reset, so the check for floats or arrays does not run every iteration
+        scalar = maximum is max and minimum is min
+        if scalar and self.W <= SCAN_WINDOW_SIZE:
+            self.update = self._scan_update(rowena_p, colin_p)
+            return
+        self.update = self._update_scalar if scalar else self._update_blocks
+        # Values of the current block, per player
+        self._rowena_block = [None] * self.W
+        self._colin_block = [None] * self.W
+        # Suffix maxima and minima of the previous block, per player
+        self._rowena_suffix = ([None] * self.W, [None] * self.W)
+        self._colin_suffix = ([None] * self.W, [None] * self.W)
+        # Position of the next value in the current block
+        self._j = 0
+        self.update(0, rowena_p, colin_p, None, None)
+
+    def _update_scalar(self, i, rowena_p, colin_p, rowena_action, colin_action):
+        # `_update_blocks` for floats, with the running and window maxima and minima inlined as comparisons
+        j = self._j
+        self._rowena_block[j] = rowena_p
+        self._colin_block[j] = colin_p
+        if j == 0:
+            rowena_max = rowena_min = rowena_p
+            colin_max = colin_min = colin_p
+        else:
+            rowena_max, rowena_min, colin_max, colin_min = self._running
+            if rowena_p > rowena_max:
+                rowena_max = rowena_p
+            elif rowena_p < rowena_min:
+                rowena_min = rowena_p
+            if colin_p > colin_max:
+                colin_max = colin_p
+            elif colin_p < colin_min:
+                colin_min = colin_p
+        self._running = (rowena_max, rowena_min, colin_max, colin_min)
+
+        epsilon = self.epsilon
+        if j == self.W - 1:
+            self._j = 0
+            self._suffixes(self._rowena_block, self._rowena_suffix)
+            self._suffixes(self._colin_block, self._colin_suffix)
+            return i > self.W and rowena_max - rowena_min < epsilon and colin_max - colin_min < epsilon
+
+        self._j = j + 1
+        if i <= self.W:
+            return False
+        suffix_max, suffix_min = self._rowena_suffix
+        high, low = suffix_max[j + 1], suffix_min[j + 1]
+        if (rowena_max if rowena_max > high else high) - (rowena_min if rowena_min < low else low) >= epsilon:
+            return False
+        suffix_max, suffix_min = self._colin_suffix
+        high, low = suffix_max[j + 1], suffix_min[j + 1]
+        return (colin_max if colin_max > high else high) - (colin_min if colin_min < low else low) < epsilon
+
+    def _update_blocks(self, i, rowena_p, colin_p, rowena_action, colin_action):
+        maximum, minimum = self.maximum, self.minimum
+        j = self._j
+        self._rowena_block[j] = rowena_p
+        self._colin_block[j] = colin_p
+
+        # Running maxima and minima of the current block
+        if j == 0:
+            self._rowena_max = self._rowena_min = rowena_p
+            self._colin_max = self._colin_min = colin_p
+        else:
+            self._rowena_max = maximum(self._rowena_max, rowena_p)
+            self._rowena_min = minimum(self._rowena_min, rowena_p)
+            self._colin_max = maximum(self._colin_max, colin_p)
+            self._colin_min = minimum(self._colin_min, colin_p)
+
+        if j == self.W - 1:
+            # The current block is complete and becomes the previous block
+            self._j = 0
+            self._suffixes(self._rowena_block, self._rowena_suffix)
+            self._suffixes(self._colin_block, self._colin_suffix)
+            if i <= self.W:
+                return False
+            # The window is exactly the completed block
+            return (self._rowena_max - self._rowena_min < self.epsilon) & (self._colin_max - self._colin_min < self.epsilon)
+
+        self._j = j + 1
+        if i <= self.W:
+            return False
+
+        # The window is the suffix of the previous block after position j plus the current block up to j
+        rowena_suffix_max, rowena_suffix_min = self._rowena_suffix
+        colin_suffix_max, colin_suffix_min = self._colin_suffix
+        rowena_range = maximum(rowena_suffix_max[j + 1], self._rowena_max) - minimum(rowena_suffix_min[j + 1], self._rowena_min)
+        colin_range = maximum(colin_suffix_max[j + 1], self._colin_max) - minimum(colin_suffix_min[j + 1], self._colin_min)
+        return (rowena_range < self.epsilon) & (colin_range < self.epsilon)
+
+    def _scan_update(self, rowena_p, colin_p):
+        # `update` for a single game with a short window, a closure over deques of each player's last `window_size` values
+        W, epsilon = self.W, self.epsilon
+        rowena_window = deque([rowena_p], maxlen=W)
+        colin_window = deque([colin_p], maxlen=W)
+
+        def update(i, rowena_p, colin_p, rowena_action, colin_action):
+            rowena_window.append(rowena_p)
+            colin_window.append(colin_p)
+            return (i > W and max(rowena_window) - min(rowena_window) < epsilon
+                    and max(colin_window) - min(colin_window) < epsilon)
+        return update
+
+    def _suffixes(self, block, suffix):
+        # Suffix maxima and minima of a completed block, once every `W` updates
+        maximum, minimum = self.maximum, self.minimum
+        suffix_max, suffix_min = suffix
+        running_max = running_min = block[-1]
+        suffix_max[-1] = suffix_min[-1] = running_max
+        for k in range(len(block) - 2, -1, -1):
+            running_max = suffix_max[k] = maximum(running_max, block[k])
+            running_min = suffix_min[k] = minimum(running_min, block[k])
+
+    def can_prove_non_convergence(self, max_plays):
+        # m below is at most half the number of plays, if the bound exceeds that it can never be met
+        return self._bound(max_plays) <= max_plays / 2
+
+    def cannot_converge(self, plays, rowena_count, colin_count, max_plays):
+        """
+        Let n be the number of times a player played their first action in k plays. One more play moves their
+        empirical mixed strategy n/k by either n/(k(k+1)) or (k-n)/(k(k+1)), so by at least m/(k(k+1)) with
+        m = min(n, k-n). The counters never decrease, so neither does m, and every remaining step is at least
+        m/(K(K-1)) where K = `max_plays`. Once that reaches epsilon for either player, every window that contains a
+        future step has a range of at least epsilon.
+
+        Only holds for fictitious play with uniform averaging.
+        """
+        rowena_m = self.minimum(rowena_count, plays - rowena_count)
+        colin_m = self.minimum(colin_count, plays - colin_count)
+        return (rowena_m >= self._bound(max_plays)) | (colin_m >= self._bound(max_plays))
+
+    def _bound(self, max_plays):
+        return self.epsilon * max_plays * (max_plays - 1)
+
+
+class ExploitabilityThreshold(ConvergenceCriterion):
+    """
+    Met once the empirical mixed strategies are less than `threshold` exploitable, see `equilibrium.exploitability`.
+
+        The threshold is relative to the game's utility range (largest minus smallest of Rowena's utilities), which
+        bounds the exploitability of any strategy profile. So `threshold=1e-2` stops within 1% of the range, whatever
+        the scale of the utilities.
+    """
+
+    def __init__(self, threshold):
+        self.threshold = threshold
+
+    def reset(self, utilities, rowena_p, colin_p, maximum=max, minimum=min):
+        super().reset(utilities, rowena_p, colin_p, maximum, minimum)
+        a, b, c, d = utilities
+        # The threshold in utility units, compared against instead of dividing every update by the range
+        self._bound = self.threshold * (maximum(maximum(a, b), maximum(c, d)) - minimum(minimum(a, b), minimum(c, d)))
+
+    def update(self, i, rowena_p, colin_p, rowena_action, colin_action):
+        return exploitability(*self.utilities, rowena_p, colin_p, maximum=self.maximum, minimum=self.minimum) < self._bound
+
+
+class RelativeChange(ConvergenceCriterion):
+    """
+    Met once neither empirical mixed strategy changed by more than a fraction `epsilon` over a geometric window.
+
+        The strategies are compared at checkpoints that grow geometrically by `ratio`, i.e. the strategy at iteration t
+        is compared to the one at roughly t/ratio. Since fictitious play slows down as 1/t, this measures the change
+        over a window proportional to the time played so far. Only the previous checkpoint is stored and updates between
+        checkpoints do nothing.
+    """
+
+    def __init__(self, epsilon, ratio=2.0):
+        if ratio <= 1:
+            raise ValueError(f"Expected ratio to be larger than 1 but got ratio={ratio}")
+        self.epsilon = epsilon
+        self.ratio = ratio
+
+    def reset(self, utilities, rowena_p, colin_p, maximum=max, minimum=min):
+        super().reset(utilities, rowena_p, colin_p, maximum, minimum)
+        self._checkpoint = 1
+        self._rowena_anchor = rowena_p
+        self._colin_anchor = colin_p
+
+    def update(self, i, rowena_p, colin_p, rowena_action, colin_action):
+        if i < self._checkpoint:
+            return False
+
+        # A strategy that stays at exactly 0 has not changed, hence `<=`
+        converged = ((abs(rowena_p - self._rowena_anchor) <= self.epsilon * abs(self._rowena_anchor))
+                     & (abs(colin_p - self._colin_anchor) <= self.epsilon * abs(self._colin_anchor)))
+        self._checkpoint = max(self._checkpoint + 1, int(self._checkpoint * self.ratio))
+        self._rowena_anchor = rowena_p
+        self._colin_anchor = colin_p
+        return converged
+
+
+class StableBestResponse(ConvergenceCriterion):
+    """ Met once both players have kept playing the same best response for `k` consecutive iterations. """
+
+    def __init__(self, k):
+        self.k = k
+
+    def reset(self, utilities, rowena_p, colin_p, maximum=max, minimum=min):
+        super().reset(utilities, rowena_p, colin_p, maximum, minimum)
+        self._rowena_action = None
+        self._colin_action = None
+        self._streak = 0
+
+    def update(self, i, rowena_p, colin_p, rowena_action, colin_action):
+        same = (rowena_action == self._rowena_action) & (colin_action == self._colin_action)
+        # Multiplying by `same` resets the streak without branching, so this also works element-wise
+        self._streak = (self._streak + 1) * same
+        self._rowena_action = rowena_action
+        self._colin_action = colin_action
+        return self._streak >= self.k
+
+
+class AllOf(ConvergenceCriterion):
+    """ Met once all of the given criteria are met. """
+
+    def __init__(self, *criteria):
+        self.criteria = criteria
+
+    def reset(self, utilities, rowena_p, colin_p, maximum=max, minimum=min):
+        super().reset(utilities, rowena_p, colin_p, maximum, minimum)
+        for criterion in self.criteria:
+            criterion.reset(utilities, rowena_p, colin_p, maximum, minimum)
+
+    def update(self, i, rowena_p, colin_p, rowena_action, colin_action):
+        # Every criterion is updated, even once the result is known, to keep their state current
+        converged = True
+        for criterion in self.criteria:
+            converged = criterion.update(i, rowena_p, colin_p, rowena_action, colin_action) & converged
+        return converged
+
+    def can_prove_non_convergence(self, max_plays):
+        return any(criterion.can_prove_non_convergence(max_plays) for criterion in self.criteria)
+
+    def cannot_converge(self, plays, rowena_count, colin_count, max_plays):
+        # All criteria must be met, so it is enough that one of them cannot be
+        cannot = False
+        for criterion in self.criteria:
+            cannot = criterion.cannot_converge(plays, rowena_count, colin_count, max_plays) | cannot
+        return cannot
+
+
+class AnyOf(ConvergenceCriterion):
+    """ Met as soon as any of the given criteria is met. """
+
+    def __init__(self, *criteria):
+        self.criteria = criteria
+
+    def reset(self, utilities, rowena_p, colin_p, maximum=max, minimum=min):
+        super().reset(utilities, rowena_p, colin_p, maximum, minimum)
+        for criterion in self.criteria:
+            criterion.reset(utilities, rowena_p, colin_p, maximum, minimum)
+
+    def update(self, i, rowena_p, colin_p, rowena_action, colin_action):
+        converged = False
+        for criterion in self.criteria:
+            converged = criterion.update(i, rowena_p, colin_p, rowena_action, colin_action) | converged
+        return converged
+
+    def can_prove_non_convergence(self, max_plays):
+        return all(criterion.can_prove_non_convergence(max_plays) for criterion in self.criteria)
+
+    def cannot_converge(self, plays, rowena_count, colin_count, max_plays):
+        # Every criterion has to be impossible
+        cannot = True
+        for criterion in self.criteria:
+            cannot = criterion.cannot_converge(plays, rowena_count, colin_count, max_plays) & cannot
+        return cannot
+
+
+# Names accepted by `Play(stopping_rule=...)`, besides `ConvergenceCriterion` instances
+STOPPING_RULES = ("window", "exploitability", "both")
+
+
+def make_criterion(stopping_rule, window_size, epsilon, exploitability_threshold):
+    """ Build the criterion for a named stopping rule, criteria instances are returned as is. """
+    if isinstance(stopping_rule, ConvergenceCriterion):
+        return stopping_rule
+    if stopping_rule == "window":
+        return WindowedRange(window_size, epsilon)
+    if stopping_rule == "exploitability":
+        return ExploitabilityThreshold(exploitability_threshold)
+    if stopping_rule == "both":
+        return AllOf(WindowedRange(window_size, epsilon), ExploitabilityThreshold(exploitability_threshold))
+    raise ValueError(f"Expected stopping_rule to be one of {STOPPING_RULES} or a ConvergenceCriterion but got stopping_rule={stopping_rule}")
@@ -0,0 +1,349 @@
+""" Hive-partitioned dataset of fictitious play trajectories, with a catalog of the sweeps it contains. """
+
+import contextlib
+import os
+import threading
+import time
+import uuid
+
+# Default location of the dataset, relative to the repository root
+DATASET_DIR = os.path.join("outputs", "dataset")
+
+# Trajectories are stored under `<dataset>/trajectories/sweep_id=<id>/epsilon=<epsilon>/window_size=<W>/part-<k>.parquet`.
+# The partition columns are encoded in the directory names only, so queries that filter on them skip
+# every other directory without opening a file
+TRAJECTORIES_DIR = "trajectories"
+PARTITION_COLUMNS = ("sweep_id", "epsilon", "window_size")
+
+# Sweeps written as action switches (one row per game, see `switches.py`) are stored in the same layout under
+# `<dataset>/switches/`, the loaders rebuild their trajectories when they are read
+SWITCHES_DIR = "switches"
+# How the games of a sweep are stored, the name of the directory they are stored in
+OUTPUTS = (TRAJECTORIES_DIR, SWITCHES_DIR)
+
+# One row per sweep, the first game id of a sweep is one past the last game id of every earlier sweep,
+# so game ids are unique across the whole dataset. The games of a sweep with a `sweep_seed` are reproduced by
+# `seeds.game_seeds(sweep_seed, number_of_games)`
+CATALOG_FILE = "catalog.parquet"
+CATALOG_COLUMNS = ["sweep_id", "created", "source", "first_game_id", "number_of_games",
+                   "epsilon", "window_size", "max_iterations", "mode", "sweep_seed", "output", "complete"]
+
+# Serializes read-modify-write cycles of the catalog within a process (e.g. dashboard sweeps finishing together)
+_catalog_lock = threading.Lock()
+# Serializes them across processes (e.g. the dashboard and `run_experiments.py` adding sweeps to the same dataset),
+# the process that creates this file next to the catalog holds the lock until it removes it again
+CATALOG_LOCK_FILE = ".catalog.lock"
+# A lock file older than this was left behind by a process that died holding it, an update takes milliseconds
+STALE_LOCK_SECONDS = 60
+
+
+def new_sweep_id():
+    """ A sweep id that sorts by creation time, with a random suffix so concurrent sweeps never collide. """
+    return f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+
+
+def partition_dir(root, sweep_id, epsilon, window_size, output=TRAJECTORIES_DIR):
+    return os.path.join(root, output, f"sweep_id={sweep_id}", f"epsilon={epsilon!r}",
+                        f"window_size={window_size}")
+
+
+def write_partition(df, root, sweep_id, part, output=TRAJECTORIES_DIR):
+    """
+    Write the trajectories of (part of) a sweep as file number `part` of the sweep's partitions.
+
+        `df` holds rows in the format of `Play.simulate_trajectory`, or with `output="switches"` in the format of
+        `BatchPlay.switches_dataframe`. Its `epsilon` and `window_size` columns decide the partition of every row and
+        are not stored in the files. Files are written under a hidden name and renamed once complete, so concurrent
+        readers never see a partially written file.
+    """
+    writer = PartitionWriter(root, sweep_id, part, output)
+    try:
+        writer.write(df)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+
+
+class PartitionWriter:
+    """
+    Write file number `part` of a sweep's partitions (see `write_partition`) one DataFrame at a time.
+
+        Every `write` appends the rows of a DataFrame to the files of their partitions as row groups, so a file can
+        hold more rows than fit in memory at once. The files only appear under their name on `close`, `abort` removes
+        them. Later DataFrames are stored with the columns and types of the first one written to the same partition.
+    """
+
+    def __init__(self, root, sweep_id, part, output=TRAJECTORIES_DIR):
+        if output not in OUTPUTS:
+            raise ValueError(f"Expected output to be one of {OUTPUTS} but got output={output}")
+        self.root = root
+        self.sweep_id = sweep_id
+        self.part = part
+        self.output = output
+        # (epsilon, window_size) -> (open ParquetWriter, hidden path, final path)
+        self._writers = {}
+
+    def write(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        for (epsilon, window_size), group in df.groupby(["epsilon", "window_size"]):
+            key = (float(epsilon), int(window_size))
+            group = group.drop(columns=["epsilon", "window_size"])
+            if key not in self._writers:
+                directory = partition_dir(self.root, self.sweep_id, *key, self.output)
+                os.makedirs(directory, exist_ok=True)
+                table = pa.Table.from_pandas(group, preserve_index=False)
+                temporary_path = os.path.join(directory, f".part-{self.part:05d}.parquet.tmp")
+                self._writers[key] = (pq.ParquetWriter(temporary_path, table.schema, compression="snappy"),
+                                      temporary_path, os.path.join(directory, f"part-{self.part:05d}.parquet"))
+            else:
+                table = pa.Table.from_pandas(group, schema=self._writers[key][0].schema, preserve_index=False)
+            self._writers[key][0].write_table(table)
+
+    def close(self):
+        for writer, temporary_path, path in self._writers.values():
+            writer.close()
+            os.replace(temporary_path, path)
+        self._writers = {}
+
+    def abort(self):
+        for writer, temporary_path, path in self._writers.values():
+            writer.close()
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+        self._writers = {}
+
+
+def read_catalog(root=DATASET_DIR):
+    """ The catalog of sweeps in the dataset as a DataFrame, empty if the dataset does not exist yet. """
+    import pandas as pd
+
+    path = os.path.join(root, CATALOG_FILE)
+    if not os.path.exists(path):
+        return pd.DataFrame({column: [] for column in CATALOG_COLUMNS})
+    return pd.read_parquet(path)
+
+
+def register_sweep(root, sweep_id, number_of_games, epsilon, window_size, max_iterations, mode="classic", source=None,
+                   sweep_seed=None, output=TRAJECTORIES_DIR):
+    """
+    Add a (not yet complete) sweep to the catalog and return the first of the `number_of_games` game ids reserved for it.
+
+        Sweeps are registered before they start, so sweeps running at the same time get disjoint game ids.
+    """
+    import pandas as pd
+
+    with _locked_catalog(root):
+        catalog = read_catalog(root)
+        if sweep_id in set(catalog["sweep_id"]):
+            raise ValueError(f"Sweep {sweep_id} is already registered in {root}")
+        first_game_id = int((catalog["first_game_id"] + catalog["number_of_games"]).max()) if len(catalog) else 0
+        row = pd.DataFrame([{
+            "sweep_id": sweep_id,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "source": source,
+            "first_game_id": first_game_id,
+            "number_of_games": number_of_games,
+            "epsilon": epsilon,
+            "window_size": window_size,
+            "max_iterations": max_iterations,
+            "mode": mode,
+            "sweep_seed": sweep_seed,
+            "output": output,
+            "complete": False
+        }])
+        _write_catalog(root, pd.concat([catalog, row], ignore_index=True) if len(catalog) else row)
+    return first_game_id
+
+
+def complete_sweep(root, sweep_id):
+    """ Mark a sweep as complete once all of its partitions are written. """
+    with _locked_catalog(root):
+        catalog = read_catalog(root)
+        catalog.loc[catalog["sweep_id"] == sweep_id, "complete"] = True
+        _write_catalog(root, catalog)
+
+
+@contextlib.contextmanager
+def _locked_catalog(root):
+    # Hold the catalog lock of the dataset in `root`, within the process and across processes
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, CATALOG_LOCK_FILE)
+    with _catalog_lock:
+        while True:
+            try:
+                # Creating the file fails if it exists, atomically, so exactly one process gets it
+                descriptor = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(path) > STALE_LOCK_SECONDS:
+                        os.remove(path)
+                        continue
+                except FileNotFoundError:
+                    # Released in the meantime
+                    continue
+                time.sleep(0.01)
+        try:
+            os.write(descriptor, str(os.getpid()).encode())
+            os.close(descriptor)
+            yield
+        finally:
+            os.remove(path)
+
+
+def _write_catalog(root, catalog):
+    os.makedirs(root, exist_ok=True)
+    path = os.path.join(root, CATALOG_FILE)
+    temporary_path = os.path.join(root, f".{CATALOG_FILE}.tmp")
+    # Catalogs written before a column existed get it filled with missing values
+    catalog.reindex(columns=CATALOG_COLUMNS).to_parquet(temporary_path, index=False)
+    os.replace(temporary_path, path)
+
+
+def trajectories(root=DATASET_DIR, output=TRAJECTORIES_DIR, sweep_ids=None, epsilon=None, window_size=None):
+    """
+    The trajectories of every sweep in the dataset as a `pyarrow.dataset.Dataset`, or `None` if there are none.
+
+        With `output="switches"`, the games of the sweeps stored as action switches instead. Only the files of the
+        partitions matching `sweep_ids`, `epsilon` and `window_size` (see `trajectory_filter`) are opened to build the
+        schema, filter the reads on the same partitions.
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    path = os.path.join(root, output)
+    if not os.path.isdir(path):
+        return None
+    # The partition types are given explicitly rather than inferred, so that e.g. a numeric looking sweep id stays a string
+    partition_schema = pa.schema([("sweep_id", pa.string()), ("epsilon", pa.float64()), ("window_size", pa.int64())])
+    partitioning = ds.partitioning(partition_schema, flavor="hive")
+    # Listing the files with only the partition columns as schema opens none of them
+    files = ds.dataset(path, format="parquet", partitioning=partitioning, schema=partition_schema)
+    # Files of different sweeps do not all have the same columns (e.g. imported files have no convergence metrics),
+    # and a dataset takes its schema from the first file it finds. The schemas of the selected files are unified
+    # instead, so columns missing from a file are read as nulls, as `union_by_name` does in `query.py`
+    fragments = files.get_fragments(filter=trajectory_filter(sweep_ids, epsilon, window_size))
+    schema = pa.unify_schemas([fragment.physical_schema for fragment in fragments] + [partition_schema],
+                              promote_options="permissive")
+    return files.replace_schema(schema)
+
+
+def trajectory_filter(sweep_ids=None, epsilon=None, window_size=None, game_ids=None):
+    """
+    Build a filter expression for `trajectories`, `None` selects everything.
+
+        Every argument is a single value or a list of values. Filters on the partition columns (`sweep_ids`, `epsilon`,
+        `window_size`) prune whole directories, a filter on `game_ids` skips the row groups whose statistics rule it out.
+    """
+    import pyarrow.dataset as ds
+
+    expression = None
+    for column, values in (("sweep_id", sweep_ids), ("epsilon", epsilon), ("window_size", window_size),
+                           ("game_id", game_ids)):
+        if values is None:
+            continue
+        if not isinstance(values, (list, tuple, set)):
+            values = [values]
+        condition = ds.field(column).isin(list(values))
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def read_trajectories(root=DATASET_DIR, columns=None, sweep_ids=None, epsilon=None, window_size=None, game_ids=None,
+                      expand_switches=True):
+    """
+    Read the trajectories matching the filters (see `trajectory_filter`) into a DataFrame.
+
+        Only the requested `columns` are decoded, the partition columns can be requested like any other column.
+        The trajectories of games stored as action switches are rebuilt and added, unless `expand_switches` is off.
+        Rebuilt trajectories have no convergence metrics, see `equilibrium.add_convergence_metrics`.
+    """
+    import pandas as pd
+
+    frames = []
+    dataset = trajectories(root, TRAJECTORIES_DIR, sweep_ids, epsilon, window_size)
+    if dataset is not None:
+        frames.append(_read(dataset, columns, trajectory_filter(sweep_ids, epsilon, window_size, game_ids)))
+    if expand_switches:
+        from switches import TRAJECTORY_COLUMNS, expand_switches as expand
+
+        games = read_switches(root, sweep_ids=sweep_ids, epsilon=epsilon, window_size=window_size, game_ids=game_ids,
+                              columns=None if columns is None else _switch_columns(columns))
+        if len(games):
+            frames.append(expand(games, columns or TRAJECTORY_COLUMNS + ["sweep_id"]))
+
+    if not frames:
+        return pd.DataFrame({column: [] for column in columns or []})
+    return frames[0] if len(frames) == 1 else pd.concat(frames, ignore_index=True)
+
+
+def read_switches(root=DATASET_DIR, columns=None, sweep_ids=None, epsilon=None, window_size=None, game_ids=None):
+    """ Read the games stored as action switches (one row per game, see `switches.py`) matching the filters. """
+    import pandas as pd
+
+    dataset = trajectories(root, SWITCHES_DIR, sweep_ids, epsilon, window_size)
+    if dataset is None:
+        return pd.DataFrame({column: [] for column in columns or []})
+    return _read(dataset, columns, trajectory_filter(sweep_ids, epsilon, window_size, game_ids))
+
+
+def _read(dataset, columns, expression):
+    if columns is not None:
+        available = set(dataset.schema.names)
+        columns = [column for column in columns if column in available]
+    return dataset.to_table(columns=columns, filter=expression).to_pandas()
+
+
+def _switch_columns(columns):
+    # The columns of the stored switches needed to rebuild the requested trajectory columns
+    needed = {"game_id", "recorded_iterations"} | set(columns)
+    for player in ("rowena", "colin"):
+        if f"{player}_probabilities" in columns:
+            needed |= {f"{player}_first_action", f"{player}_switches"}
+    return sorted(needed)
+
+
+def import_parquet(path, root=DATASET_DIR):
+    """
+    Add a single-file output (e.g. a `mega.parquet` written before the dataset layout existed) to the dataset as a
+    new sweep and return its sweep id. Game ids are shifted to follow the games already in the dataset.
+    """
+    import pyarrow.parquet as pq
+
+    parquet_file = pq.ParquetFile(path)
+    summary = pq.read_table(path, columns=["game_id", "epsilon", "window_size", "max_iteration"]).to_pandas()
+    game_ids = summary["game_id"].unique()
+    # Single values are recorded in the catalog, files mixing several leave the catalog entry empty
+    single = lambda column: summary[column].iloc[0] if summary[column].nunique() == 1 else None
+
+    sweep_id = new_sweep_id()
+    max_plays = single("max_iteration")
+    first_game_id = register_sweep(root, sweep_id, len(game_ids), single("epsilon"), single("window_size"),
+                                   None if max_plays is None else max_plays - 1, source=f"import:{os.path.basename(path)}")
+    offset = first_game_id - int(game_ids.min())
+
+    # Row group by row group, so files larger than memory can be imported
+    for part in range(parquet_file.num_row_groups):
+        df = parquet_file.read_row_group(part).to_pandas()
+        df["game_id"] += offset
+        write_partition(df, root, sweep_id, part)
+    complete_sweep(root, sweep_id)
+    return sweep_id
+
+
+# Example usage, listing the sweeps in the dataset (and importing a single-file output with `--import`):
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect the fictitious play dataset")
+    parser.add_argument("--dataset", type=str, default=DATASET_DIR, help="Root directory of the dataset.")
+    parser.add_argument("--import", dest="import_file", type=str, default=None,
+                        help="Add a single parquet file to the dataset as a new sweep.")
+    args = parser.parse_args()
+
+    if args.import_file:
+        print(f"Imported {args.import_file} as sweep {import_parquet(args.import_file, args.dataset)}")
+    print(read_catalog(args.dataset).to_string())
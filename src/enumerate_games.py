@@ -0,0 +1,281 @@
+""" Exhaustive sweeps over every game with utilities in [min_util, max_util], sharded and resumable. """
+
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from batch_play import BatchPlay, DEDUPLICATION_MODES
+from canonical import equivalence_classes
+from fictitious_play import CONVERGED, DID_NOT_CONVERGE, SADDLE_POINT, CANNOT_CONVERGE
+from progress import ProgressReporter, SWEEP
+
+# What is enumerated:
+#   "games":    every play, i.e. every game in [min_util, max_util]^4 with each of the 4 pairs of first actions.
+#               A play's index encodes it in mixed radix, ((((a*R + b)*R + c)*R + d)*4 + 2*rowena_action + colin_action)
+#               with R = max_util - min_util + 1 and the utilities counted from min_util
+#   "classes":  one play per class of equivalent plays (see `canonical.py`), weighted by the number of plays in the class
+SPACES = ("games", "classes")
+
+STATUSES = [CONVERGED, DID_NOT_CONVERGE, SADDLE_POINT, CANNOT_CONVERGE]
+
+# Classes of this many plays at a time are canonicalized while building the class table
+CLASS_TABLE_CHUNK = 10**6
+
+
+class Enumeration:
+    def __init__(self,
+                 output_dir,
+                 min_util=-5,
+                 max_util=5,
+                 space="games",
+                 symmetries="exact",
+                 max_iterations=10**4,
+                 window_size=10,
+                 epsilon=1e-4,
+                 mode="classic",
+                 batch_size=1024,
+                 chunk_size=2**16,
+                 progress=None):
+
+        if space not in SPACES:
+            raise ValueError(f"Expected space to be one of {SPACES} but got space={space}")
+        if min_util > max_util:
+            raise ValueError(f"Expected min_util <= max_util but got min_util={min_util}, max_util={max_util}")
+        # Playing one representative per class is only exact for the modes in which the symmetries preserve the play,
+        # the same restriction as `BatchPlay(deduplicate=...)`
+        if space == "classes" and mode not in DEDUPLICATION_MODES.get(symmetries, ()):
+            raise ValueError(f"Expected symmetries to be one of {tuple(DEDUPLICATION_MODES)} with a mode in "
+                             f"{DEDUPLICATION_MODES.get(symmetries)} but got symmetries={symmetries}, mode={mode}")
+
+        self.output_dir = output_dir
+        # Everything that determines the results, a resumed enumeration must use the same parameters
+        self.parameters = dict(min_util=min_util, max_util=max_util, space=space, symmetries=symmetries,
+                               max_iterations=max_iterations, window_size=window_size, epsilon=epsilon, mode=mode,
+                               chunk_size=chunk_size)
+        self.min_util = min_util
+        self.radix = max_util - min_util + 1
+        self.space = space
+        self.symmetries = symmetries
+        # Every chunk of `chunk_size` plays is written to its own file, which is the unit of resumption
+        self.chunk_size = chunk_size
+        self.batch_play = BatchPlay(max_iterations=max_iterations, window_size=window_size, epsilon=epsilon,
+                                    mode=mode, batch_size=batch_size)
+        # Optional `progress.ProgressReporter`, told about the plays of every finished chunk
+        self.progress = progress
+        self._classes = None
+
+    def __getstate__(self):
+        # Worker processes read the class table from the output directory instead of receiving it with every chunk,
+        # and report nothing themselves
+        state = self.__dict__.copy()
+        state["_classes"] = None
+        state["progress"] = None
+        return state
+
+    @property
+    def number_of_plays(self):
+        return 4 * self.radix**4
+
+    def __len__(self):
+        # The number of plays to simulate
+        return self.number_of_plays if self.space == "games" else len(self.classes()[0])
+
+    def decode(self, indices):
+        """ The utilities (n, 4) and first actions (n, 2) of the plays with the given indices. """
+        indices = np.asarray(indices, dtype=np.int64)
+        first_actions = np.column_stack([(indices % 4) // 2, indices % 2])
+        games = indices // 4
+        utilities = np.empty((len(indices), 4), dtype=np.int64)
+        for k in (3, 2, 1, 0):
+            utilities[:, k] = self.min_util + games % self.radix
+            games //= self.radix
+        return utilities, first_actions
+
+    def classes(self):
+        """
+        The canonical games (m, 4), first actions (m, 2) and sizes (m,) of the classes of all plays.
+
+            Computed in chunks and cached in the output directory. The table is sorted, so every process and node that
+            computes it gets the same class indices.
+        """
+        if self._classes is not None:
+            return self._classes
+        path = os.path.join(self.output_dir, "classes.parquet")
+        if os.path.exists(path):
+            df = pd.read_parquet(path)
+        else:
+            tables = []
+            for start in range(0, self.number_of_plays, CLASS_TABLE_CHUNK):
+                utilities, first_actions = self.decode(np.arange(start, min(start + CLASS_TABLE_CHUNK, self.number_of_plays)))
+                canonical, canonical_actions, inverse, _ = equivalence_classes(utilities, first_actions, self.symmetries)
+                tables.append(pd.DataFrame(np.column_stack([canonical, canonical_actions, np.bincount(inverse)]),
+                                           columns=["a", "b", "c", "d", "rowena_action", "colin_action", "size"]))
+            # The same class can show up in several chunks
+            keys = ["a", "b", "c", "d", "rowena_action", "colin_action"]
+            df = pd.concat(tables, ignore_index=True).groupby(keys, as_index=False)["size"].sum()
+            _write_atomic(df, path)
+        values = df[["a", "b", "c", "d"]].to_numpy(np.int64)
+        self._classes = (values, df[["rowena_action", "colin_action"]].to_numpy(np.int64), df["size"].to_numpy(np.int64))
+        return self._classes
+
+    def shard(self, shard, shards):
+        """ The chunks, as (start, stop) ranges of play (or class) indices, of shard number `shard` out of `shards`. """
+        if not 0 <= shard < shards:
+            raise ValueError(f"Expected 0 <= shard < shards but got shard={shard}, shards={shards}")
+        # Contiguous index ranges per shard, split on chunk boundaries so every chunk belongs to exactly one shard
+        number_of_chunks = -(-len(self) // self.chunk_size)
+        first, last = shard * number_of_chunks // shards, (shard + 1) * number_of_chunks // shards
+        return [(k * self.chunk_size, min((k + 1) * self.chunk_size, len(self))) for k in range(first, last)]
+
+    def run(self, shard=0, shards=1, max_workers=None):
+        """
+        Simulate the chunks of a shard in a pool of worker processes, skipping chunks that are already written.
+
+            Run the same enumeration with `shard=0..shards-1` on different nodes (sharing `output_dir`, or merging
+            their output directories afterwards) to split the work.
+        """
+        self._check_manifest()
+        if self.space == "classes":
+            # Built once up front rather than by every worker
+            self.classes()
+        chunks = [chunk for chunk in self.shard(shard, shards) if not os.path.exists(self._chunk_path(*chunk))]
+        if not chunks:
+            return 0
+
+        if self.progress is not None:
+            self.progress.start(sum(stop - start for start, stop in chunks))
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for (start, stop), status, iterations in executor.map(self._run_chunk, chunks):
+                if self.progress is not None:
+                    self.progress.games_done(range(start, stop), status, iterations)
+        if self.progress is not None:
+            self.progress.finish()
+        return len(chunks)
+
+    def _run_chunk(self, chunk):
+        start, stop = chunk
+        if self.space == "games":
+            indices = np.arange(start, stop, dtype=np.int64)
+            utilities, first_actions = self.decode(indices)
+        else:
+            canonical, canonical_actions, _ = self.classes()
+            indices = np.arange(start, stop, dtype=np.int64)
+            utilities, first_actions = canonical[start:stop], canonical_actions[start:stop]
+
+        results = [self.batch_play._play(utilities[k:k + self.batch_play.batch_size].astype(float),
+                                         first_actions[k:k + self.batch_play.batch_size], record=False)
+                   for k in range(0, len(indices), self.batch_play.batch_size)]
+        # Compact rows: the play is identified by its index, from which `decode` (or the class table) recovers it
+        df = pd.DataFrame({
+            "index": indices,
+            "status": pd.Categorical(np.concatenate([result["status"] for result in results]), categories=STATUSES),
+            "iterations": np.concatenate([result["plays"] for result in results]).astype(np.int32),
+            "rowena_probability": np.concatenate([result["rowena_p"] for result in results]).astype(np.float32),
+            "colin_probability": np.concatenate([result["colin_p"] for result in results]).astype(np.float32)
+        })
+        _write_atomic(df, self._chunk_path(start, stop))
+        return chunk, df["status"].to_numpy(), df["iterations"].to_numpy()
+
+    def results(self, columns=None):
+        """ The rows of every chunk written so far. """
+        files = sorted(file for file in os.listdir(self.output_dir) if file.startswith("chunk-"))
+        if not files:
+            return pd.DataFrame(columns=columns or ["index", "status", "iterations", "rowena_probability", "colin_probability"])
+        return pd.concat([pd.read_parquet(os.path.join(self.output_dir, file), columns=columns) for file in files],
+                         ignore_index=True)
+
+    def summarize(self):
+        """
+        Aggregate the chunks into summary tables, weighting every class by the number of plays in it.
+
+        Returns a dict with
+            "status":     the number and fraction of plays per status,
+            "iterations": statistics of the number of plays per status,
+            "coverage":   how many of the plays have been simulated so far.
+        """
+        df = self.results(columns=["index", "status", "iterations"])
+        if self.space == "classes":
+            df["weight"] = self.classes()[2][df["index"].to_numpy()]
+        else:
+            df["weight"] = 1
+
+        status = df.groupby("status", observed=False)["weight"].sum().rename("plays").to_frame()
+        status["fraction"] = status["plays"] / max(status["plays"].sum(), 1)
+
+        # Weighted mean and quantiles of the number of plays, per status
+        rows = []
+        for name, group in df.groupby("status", observed=True):
+            group = group.sort_values("iterations")
+            cumulative = group["weight"].cumsum().to_numpy() / group["weight"].sum()
+            iterations = group["iterations"].to_numpy()
+            quantile = lambda q: iterations[np.searchsorted(cumulative, q)]
+            rows.append({"status": name, "mean": np.average(iterations, weights=group["weight"]),
+                         "p10": quantile(0.1), "median": quantile(0.5), "p90": quantile(0.9), "max": iterations[-1]})
+        iterations = pd.DataFrame(rows, columns=["status", "mean", "p10", "median", "p90", "max"])
+
+        coverage = pd.DataFrame([{"simulated": int(df["weight"].sum()), "total": self.number_of_plays}])
+        tables = {"status": status.reset_index(), "iterations": iterations, "coverage": coverage}
+        for name, table in tables.items():
+            table.to_parquet(os.path.join(self.output_dir, f"summary_{name}.parquet"), index=False)
+        return tables
+
+    def _chunk_path(self, start, stop):
+        return os.path.join(self.output_dir, f"chunk-{start:012d}-{stop:012d}.parquet")
+
+    def _check_manifest(self):
+        # Refuse to resume into an output directory that holds results for different parameters
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, "manifest.json")
+        if os.path.exists(path):
+            with open(path) as f:
+                manifest = json.load(f)
+            if manifest["parameters"] != self.parameters:
+                raise ValueError(f"{self.output_dir} holds an enumeration with parameters {manifest['parameters']}, "
+                                 f"which differ from {self.parameters}")
+            return
+        with open(path, "w") as f:
+            json.dump({"parameters": self.parameters, "created": time.strftime("%Y-%m-%d %H:%M:%S")}, f, indent=2)
+
+
+def _write_atomic(df, path):
+    # Write under a temporary name and rename, so an interrupted write never leaves a chunk that looks complete
+    directory, name = os.path.split(path)
+    os.makedirs(directory, exist_ok=True)
+    temporary_path = os.path.join(directory, f".{name}.tmp")
+    df.to_parquet(temporary_path, compression="zstd", index=False)
+    os.replace(temporary_path, path)
+
+
+# Example usage, every class of plays with utilities in [-5, 5]. On several nodes, run with
+# `--shard k --shards N` for k = 0..N-1 and the same output directory:
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Exhaustive fictitious play sweep over small utility ranges")
+    parser.add_argument("--output_dir", type=str, default=os.path.join("outputs", "enumeration"))
+    parser.add_argument("--min_util", type=int, default=-5)
+    parser.add_argument("--max_util", type=int, default=5)
+    parser.add_argument("--space", type=str, default="classes", choices=SPACES)
+    parser.add_argument("--symmetries", type=str, default="exact", choices=("exact", "strategic"),
+                        help="Which plays count as equivalent in the classes space, see canonical.py.")
+    parser.add_argument("--max_iterations", type=int, default=10**4)
+    parser.add_argument("--epsilon", type=float, default=1e-4)
+    parser.add_argument("--shard", type=int, default=0)
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    # Report the plays per status of the finished chunks at most every few seconds
+    progress = ProgressReporter(verbosity=SWEEP, min_interval=5.0)
+    enumeration = Enumeration(args.output_dir, min_util=args.min_util, max_util=args.max_util, space=args.space,
+                              symmetries=args.symmetries, max_iterations=args.max_iterations, epsilon=args.epsilon,
+                              progress=progress)
+    print(f"{len(enumeration)} {args.space} to simulate, shard {args.shard + 1}/{args.shards}")
+    enumeration.run(args.shard, args.shards, max_workers=args.workers)
+
+    for name, table in enumeration.summarize().items():
+        print(f"\n{name}:\n{table.to_string(index=False)}")
@@ -0,0 +1,166 @@
+""" Analytic Nash equilibria and convergence-error metrics for zero-sum games. """
+
+import numpy as np
+
+
+def game_utilities(game_lists):
+    """
+    Convert games in the `Game.to_list` format to an (n, 4) array of Rowena's utilities.
+
+        Each row holds (a, b, c, d) where 'a' corresponds to cell (0,0), 'b' to (0,1), 'c' to (1,0) and 'd' to (1,1).
+    """
+    return np.array([[cell[0] for cell in game] for game in game_lists], dtype=float).reshape(-1, 4)
+
+
+def solve_2x2(a, b, c, d):
+    """
+    Solve 2x2 zero-sum games in closed form, vectorized over arrays of Rowena's utilities.
+
+        Rowena maximizes and Colin minimizes Rowena's utility. The game has a pure saddle point when
+        maximin = max(min(a, b), min(c, d)) equals minimax = min(max(a, c), max(b, d)), in which case that is the
+        value v. Otherwise both players mix and
+
+                v = (a*d - b*c) / (a - b - c + d)
+
+        A game can have a whole interval of optimal strategies (e.g. when a row is weakly dominated), so instead of a
+        single point we return the set of optimal strategies of each player. With p the probability that Rowena plays
+        her first action, p is optimal if and only if it guarantees the value against both of Colin's actions:
+
+                p * a + (1-p) * c >= v      and      p * b + (1-p) * d >= v
+
+        and similarly for Colin's q with <= v. Each constraint bounds p (resp. q) from one side.
+
+    Returns the arrays (p_low, p_high, q_low, q_high, value).
+    """
+    a, b, c, d = (np.asarray(u, dtype=float) for u in (a, b, c, d))
+
+    maximin = np.maximum(np.minimum(a, b), np.minimum(c, d))
+    minimax = np.minimum(np.maximum(a, c), np.maximum(b, d))
+    denominator = a - b - c + d
+    # The mixed formula is only used where there is no saddle point, in which case the denominator is non-zero
+    with np.errstate(divide="ignore", invalid="ignore"):
+        value = np.where(maximin == minimax, maximin, (a * d - b * c) / denominator)
+
+    p_low, p_high = _optimal_interval([(a - c, value - c), (b - d, value - d)], at_least=True)
+    q_low, q_high = _optimal_interval([(a - b, value - b), (c - d, value - d)], at_least=False)
+    return p_low, p_high, q_low, q_high, value
+
+
+def _optimal_interval(constraints, at_least):
+    # Intersect the constraints `slope * x >= rhs` (or `<=` when `at_least` is False) with [0, 1]
+    low, high = 0.0, 1.0
+    for slope, rhs in constraints:
+        if not at_least:
+            slope, rhs = -slope, -rhs
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bound = rhs / slope
+        low = np.where(slope > 0, np.maximum(low, bound), low)
+        high = np.where(slope < 0, np.minimum(high, bound), high)
+    return np.clip(low, 0.0, 1.0), np.clip(high, 0.0, 1.0)
+
+
+def solve_lp(utilities):
+    """
+    Solve a general m x n zero-sum game with linear programming.
+
+        Rowena picks the mixed strategy x that maximizes v subject to (x^T A)_j >= v for every column j, Colin's
+        strategy y is the solution of the dual problem. Requires scipy.
+
+    Returns (x, y, value).
+    """
+    try:
+        from scipy.optimize import linprog
+    except ImportError as e:
+        raise ImportError("Solving general games requires scipy, install it with `pip install scipy`") from e
+
+    A = np.asarray(utilities, dtype=float)
+    m, n = A.shape
+
+    # Variables are (x_1, ..., x_m, v), minimize -v
+    # subject to v - (x^T A)_j <= 0 for all columns j and sum(x) = 1
+    row = linprog(
+        c=np.r_[np.zeros(m), -1.0],
+        A_ub=np.c_[-A.T, np.ones(n)],
+        b_ub=np.zeros(n),
+        A_eq=np.r_[np.ones(m), 0.0].reshape(1, -1),
+        b_eq=[1.0],
+        bounds=[(0, None)] * m + [(None, None)],
+        method="highs"
+    )
+    if not row.success:
+        raise RuntimeError(f"Linear program for Rowena's strategy failed: {row.message}")
+
+    # The duals of the column constraints are Colin's optimal strategy
+    y = np.abs(row.ineqlin.marginals)
+    return row.x[:m], y / y.sum(), row.x[m]
+
+
+def solve_games(utilities):
+    """
+    Solve a batch of zero-sum games given as an (n, rows, columns) array of Rowena's utilities.
+
+        2x2 games are solved in closed form in a single vectorized call, other shapes with one linear program per game.
+
+    Returns (row_strategies, column_strategies, values). For 2x2 games the strategies are the probabilities of the
+    first action at the midpoint of each player's set of optimal strategies.
+    """
+    utilities = np.asarray(utilities, dtype=float)
+    if utilities.shape[1:] == (2, 2):
+        p_low, p_high, q_low, q_high, value = solve_2x2(utilities[:, 0, 0], utilities[:, 0, 1],
+                                                        utilities[:, 1, 0], utilities[:, 1, 1])
+        return (p_low + p_high) / 2, (q_low + q_high) / 2, value
+
+    solutions = [solve_lp(A) for A in utilities]
+    return (np.array([x for x, _, _ in solutions]), np.array([y for _, y, _ in solutions]),
+            np.array([v for _, _, v in solutions]))
+
+
+def exploitability(a, b, c, d, p, q, maximum=np.maximum, minimum=np.minimum):
+    """
+    Exploitability of the strategy profile (p, q) in the 2x2 zero-sum game with Rowena's utilities (a, b, c, d).
+
+        This is how much Rowena could gain by best responding to q plus how much Colin could gain by best responding
+        to p. It is zero exactly at an equilibrium and does not require solving the game:
+
+                max(a*q + b*(1-q), c*q + d*(1-q)) - min(a*p + c*(1-p), b*p + d*(1-p))
+
+    Works element-wise on arrays, or on plain floats when passing the builtin `max` and `min`.
+    """
+    best_row = maximum(a * q + b * (1 - q), c * q + d * (1 - q))
+    best_column = minimum(a * p + c * (1 - p), b * p + d * (1 - p))
+    return best_row - best_column
+
+
+def distance_to_equilibrium(p, q, p_low, p_high, q_low, q_high):
+    """ Euclidean distance from (p, q) to the (rectangular) set of equilibria of a 2x2 zero-sum game. """
+    p_gap = np.maximum(np.maximum(p_low - p, p - p_high), 0.0)
+    q_gap = np.maximum(np.maximum(q_low - q, q - q_high), 0.0)
+    return np.hypot(p_gap, q_gap)
+
+
+def add_convergence_metrics(df):
+    """
+    Add the `distance_to_equilibrium` and `exploitability` of every recorded iteration to a trajectory DataFrame.
+
+        Every game in the DataFrame is solved once, in a single vectorized call, and the metrics are then computed for
+        all rows at once. Games are read from the `game` column, or rebuilt from their `seed` if it is missing.
+    """
+    if "game" in df.columns:
+        games = df.groupby("game_id", sort=False)["game"].first()
+    else:
+        from arbitrary_games import Game
+        games = df.groupby("game_id", sort=False)["seed"].first().map(lambda seed: Game(seed=int(seed)).to_list())
+
+    utilities = game_utilities(games.values)
+    p_low, p_high, q_low, q_high, _ = solve_2x2(*utilities.T)
+
+    # Position of each row's game in the solved batch
+    codes = games.index.get_indexer(df["game_id"])
+    a, b, c, d = (utilities[codes, k] for k in range(4))
+    p = df["rowena_probabilities"].to_numpy(dtype=float)
+    q = df["colin_probabilities"].to_numpy(dtype=float)
+
+    df = df.copy()
+    df["distance_to_equilibrium"] = distance_to_equilibrium(p, q, p_low[codes], p_high[codes], q_low[codes], q_high[codes])
+    df["exploitability"] = exploitability(a, b, c, d, p, q)
+    return df
@@ -1,10 +1,33 @@
 import random
-from random import randint
-from collections import deque
 import pandas as pd
 import os
+import warnings
+
+import numpy as np
 
 from arbitrary_games import Game
+from convergence import make_criterion, WindowedRange
+from progress import ProgressReporter, ITERATION
+import kernels
+
+# Outcomes of a fictitious play, stored in the `status` column of the output
+CONVERGED = "converged"
+DID_NOT_CONVERGE = "did not converge"
+# The game has a strict pure-strategy saddle point, its outcome is known without playing
+SADDLE_POINT = "saddle point"
+# The empirical mixed strategies provably cannot meet the convergence criteria within the maximum number of iterations
+CANNOT_CONVERGE = "cannot converge"
+
+# Statuses of the compiled kernel's status codes, see `kernels.py`
+KERNEL_STATUSES = {kernels.KERNEL_CONVERGED: CONVERGED,
+                   kernels.KERNEL_DID_NOT_CONVERGE: DID_NOT_CONVERGE,
+                   kernels.KERNEL_CANNOT_CONVERGE: CANNOT_CONVERGE}
+
+# Implementations of the per-iteration loop:
+#   "python": the reference implementation in `Play._play`, works with every stopping rule
+#   "numba":  the compiled kernel in `kernels.py`, only for the "window" stopping rule and requires numba
+#   "auto":   "numba" whenever it can be used, "python" otherwise
+BACKENDS = ("auto", "python", "numba")
 
 class Play:
     def __init__(self,
@@ -12,7 +35,12 @@ class Play:
                  window_size=10,
                  epsilon=1e-3,
                  output_file=None,
-                 seed=132):
+                 seed=132,
+                 early_termination=True,
+                 stopping_rule="window",
+                 exploitability_threshold=1e-2,
+                 backend="auto",
+                 progress=None):
         
         # `max_iterations + 1` ensures that we play up to and including the specified maximum
         self.max_iterations = max_iterations + 1
@@ -20,6 +48,24 @@ class Play:
         self.epsilon = epsilon
         self.output_file = output_file
         self.seed = seed
+        # Stop early on games whose outcome can be proven, see `saddle_point` and `ConvergenceCriterion.cannot_converge`
+        self.early_termination = early_termination
+        # When to stop playing: "window" (the last `window_size` empirical mixed strategies are within epsilon),
+        # "exploitability" (less than `exploitability_threshold` exploitable, as a fraction of the game's utility range),
+        # "both", or any `ConvergenceCriterion`
+        self.criterion = make_criterion(stopping_rule, window_size, epsilon, exploitability_threshold)
+
+        if backend not in BACKENDS:
+            raise ValueError(f"Expected backend to be one of {BACKENDS} but got backend={backend}")
+        if backend == "numba" and not kernels.NUMBA_AVAILABLE:
+            raise ImportError("The numba backend requires numba, install it with `pip install numba`")
+        # The kernel hard-codes the window criterion, other criteria always run in Python
+        compiled = kernels.NUMBA_AVAILABLE and type(self.criterion) is WindowedRange
+        if backend == "numba" and not compiled:
+            warnings.warn(f"The numba backend only supports the window stopping rule, using the python backend for stopping_rule={stopping_rule}")
+        self.backend = "numba" if backend != "python" and compiled else "python"
+        # Optional `progress.ProgressReporter`, plays are silent without one
+        self.progress = progress
 
     def best_response(self,
                       game : Game,
@@ -60,84 +106,106 @@ class Play:
         else:
             return 1
         
-    def run_fictitious_play(self, game, game_id=None):
-        # Set seed
-        random.seed(self.seed)
+    @staticmethod
+    def first_actions(seed):
+        """
+        Both players' actions in round 0, drawn from the game's own random stream `random.Random(seed)`.
+
+            No global random state is touched, so plays can run in several threads at once and their results do not
+            depend on the order in which they are run. The actions are the same as those drawn after `random.seed(seed)`.
+        """
+        rng = random.Random(seed)
+        return rng.randint(0, 1), rng.randint(0, 1)
+
+    @staticmethod
+    def saddle_point(game : Game):
+        """
+        Return the (row, column) actions of a strict pure-strategy saddle point, or `None` if the game has none.
+
+            Cell (i, j) is a strict saddle point when Rowena's utility there is strictly larger than in the other row
+            of column j and strictly smaller than in the other column of row i. A strict saddle point is the unique
+            equilibrium of a 2x2 zero-sum game and fictitious play converges to the equilibrium of every zero-sum
+            game (Robinson, 1951), so the empirical mixed strategies converge to this pure strategy profile.
+        """
+        a, b, c, d = game.game["player_1"].values()
+        utilities = [[a, b], [c, d]]
+        for i in (0, 1):
+            for j in (0, 1):
+                if utilities[i][j] > utilities[1-i][j] and utilities[i][j] < utilities[i][1-j]:
+                    return i, j
+        return None
 
+    def run_fictitious_play(self, game, game_id=None):
         # If an output path is specified, run so that it saves the data to that location 
         if self.output_file:
             return self.run_fictitious_play_with_output(game, game_id)
 
-        # Let a_0 denote the action of the first player in round 0 and b_0 the second player's
-        a_0, b_0 = randint(0, 1), randint(0, 1)
-
-        # Track each player's empirical mixed strategy
-        # Keep a counter of how many times each player has played their first action
-        # For iteration i, their empirical mixed strategy is this number divided by i
-        # if a_0 is 0, then Rowena played her first action, otherwise her second action
-        rowena_strategy = 1 if a_0 == 0 else 0
-        colin_strategy = 1 if b_0 == 0 else 0
+        # Games with a strict saddle point converge to it, there is no need to play them
+        if self.early_termination and self.saddle_point(game) is not None:
+            self._report_done(game_id, SADDLE_POINT, 0)
+            return SADDLE_POINT, SADDLE_POINT, 0
+
+        status, plays, rowena_strategy, colin_strategy, _, _ = self._play(game, record=False, game_id=game_id)
+        self._report_done(game_id, status, plays)
+        if status == CONVERGED:
+            # Return the players action counters and on which iteration it converged
+            return rowena_strategy, colin_strategy, plays
+        return status, status, plays
+    
+    def run_fictitious_play_with_output(self, game, game_id):
+        # Run the fictitious play and write the empirical mixed strategies to the output file
+        df = self.simulate_trajectory(game, game_id)
 
-        # Keep track of the players last `W` empirical mixed strategy to determine convergence
-        # Initialize an empty deque and add the first actions
-        rowena_deque = deque(maxlen=self.W)
-        colin_deque = deque(maxlen=self.W)
-        rowena_deque.append(rowena_strategy)
-        colin_deque.append(colin_strategy)
-        
-        # For printing
-        print_ten_times = self.max_iterations // 10
+        # Create a new parquet file for each game_id
+        output_file = f"{self.output_file.split('.parquet')[0]}_game_{game_id}.parquet"
+        df.to_parquet(output_file, compression="snappy")
 
-        # Begin the iterated fictitious play until the convergence criteria is met or until
-        # the maximum number of iterations are exceeded
-        for i in range(1, self.max_iterations):
+        # Return `None` to ensure the same format as `self.run_fictitious_play` 
+        return None, None, None
 
-            # Compute what each player's best response is to their opponents latest empirical mixed strategy
-            rowena_action = self.best_response(game, "player_1", colin_strategy/i)
-            colin_action = self.best_response(game, "player_2", rowena_strategy/i)
+    def simulate_trajectory(self, game, game_id):
+        """ Run the fictitious play and return the empirical mixed strategies of every iteration as a DataFrame. """
+        if game_id is None:
+            raise AssertionError(f"Expected a game_id but got game_id={game_id}")
 
-            # Update the players action counters
-            rowena_strategy += rowena_action
-            colin_strategy += colin_action
-
-            # Update the last `W` empirical mixed strategies
-            # Pop the leftmost element only after `self.W` many iterations
-            # Because the deque does not contain a history of `self.W` many elements until then
-            if i > self.W:
-                _ = rowena_deque.popleft()
-                _ = colin_deque.popleft()
-            rowena_deque.append(rowena_strategy/(i+1))
-            colin_deque.append(colin_strategy/(i+1))
+        # Games with a strict saddle point converge to it, record the limit as the only iteration
+        saddle_point = self.saddle_point(game) if self.early_termination else None
+        if saddle_point is not None:
+            rowena_action, colin_action = saddle_point
+            self._report_done(game_id, SADDLE_POINT, 0)
+            return self._trajectory_dataframe(game, game_id, [0], [float(rowena_action == 0)],
+                                              [float(colin_action == 0)], SADDLE_POINT)
 
-            # Check if convergence criteria is met 
-            # Only start checking once the deque's are filled
-            # Otherwise the game trivially converges when the deques contain a single element 
-            if (i > self.W) and (max(rowena_deque) - min(rowena_deque) < self.epsilon) and (max(colin_deque) - min(colin_deque) < self.epsilon):
-                # Return the players action counters and on which iteration it converged
-                return rowena_strategy, colin_strategy, i+1
-                
-            if i % print_ten_times == 0:
-                print(f"\t\t\t\tRowena | Colin \t(Iteration {i})\nEmpirical Mixed Strategy: \t {rowena_strategy/i:.4f}\t  {colin_strategy/i:.4f}")
+        status, plays, _, _, rowena_list, colin_list = self._play(game, record=True, game_id=game_id)
+        self._report_done(game_id, status, plays)
 
+        # Create a list of the iterations
+        iteration_list = list(range(plays))
         
-        # If the loop terminates without returning it must be because the maximum number
-        # of iterations were exceeded
-        return "did not converge", "did not converge", self.max_iterations
-    
-    def run_fictitious_play_with_output(self, game, game_id):
-        if game_id is None:
-            raise AssertionError(f"Expected a game_id but got game_id={game_id}")
-        
-        # Set seed
-        random.seed(self.seed)
+        # Check the the lengths of the lists to be saved are the same
+        if (len(iteration_list) != len(rowena_list)) or (len(rowena_list) != len(colin_list)):
+            raise AssertionError(f"""Expected all lists to be of the same length but got 
+                                 len(iteration_list)={len(iteration_list)}, len(rowena_list))={len(rowena_list)},
+                                 len(colin_list)={len(colin_list)}.""")
 
-        # Store the empirical mixed strategies throughout fictitious play
-        # i.e. the estimated probability of a player's first action
-        rowena_list = []
-        colin_list = []
+        return self._trajectory_dataframe(game, game_id, iteration_list, rowena_list, colin_list, status)
+
+    def _report_done(self, game_id, status, plays):
+        if self.progress is not None:
+            self.progress.game_done(game_id, status, plays)
+
+    def _play(self, game, record, game_id=None):
+        """
+        Play until the convergence criterion is met or until the maximum number of iterations is reached.
+
+        Returns the status, the number of plays, both players' action counters and, if `record` is set, the lists of
+        their empirical mixed strategies at every iteration (otherwise `None`).
+        """
+        if self.backend == "numba":
+            return self._play_compiled(game, record)
 
         # Let a_0 denote the action of the first player in round 0 and b_0 the second player's
-        a_0, b_0 = randint(0, 1), randint(0, 1)
+        a_0, b_0 = self.first_actions(self.seed)
 
         # Track each player's empirical mixed strategy
         # Keep a counter of how many times each player has played their first action
@@ -146,21 +214,30 @@ class Play:
         rowena_strategy = 1 if a_0 == 0 else 0
         colin_strategy = 1 if b_0 == 0 else 0
 
-        # Keep track of the players last `W` empirical mixed strategy to determine convergence
-        # Initialize an empty deque and add the first actions
-        rowena_deque = deque(maxlen=self.W)
-        colin_deque = deque(maxlen=self.W)
-        rowena_deque.append(rowena_strategy)
-        colin_deque.append(colin_strategy)
+        # The criterion keeps whatever history of the empirical mixed strategies it needs,
+        # starting from the first actions
+        criterion = self.criterion
+        criterion.reset(tuple(game.game["player_1"].values()), rowena_strategy/1, colin_strategy/1)
 
-        # Store the first action probability
+        # Store the empirical mixed strategies throughout fictitious play
+        # i.e. the estimated probability of a player's first action
         # Each probability is estimated as the number of times they have played that action
         # divided by the number of iterations
-        rowena_list.append(rowena_strategy/1)
-        colin_list.append(colin_strategy/1)
+        rowena_list = [rowena_strategy/1] if record else None
+        colin_list = [colin_strategy/1] if record else None
         
-        # For printing
-        print_ten_times = self.max_iterations // 10
+        # Iteration at which to next check whether convergence is still possible. The check runs
+        # every `W` iterations, or never (past the last iteration) if the criterion can't prove anything
+        if self.early_termination and criterion.can_prove_non_convergence(self.max_iterations):
+            next_bound_check = self.W
+        else:
+            next_bound_check = self.max_iterations
+
+        # Iteration at which to next report the empirical mixed strategies, never without an iteration-level reporter
+        report_every = self.progress.iteration_interval(self.max_iterations) if self.progress is not None else None
+        next_report = report_every if report_every else self.max_iterations
+        # The loop only compares against the nearest of the two, so it does no extra work per iteration
+        next_checkpoint = min(next_bound_check, next_report)
 
         # Begin the iterated fictitious play until the convergence criteria is met or until
         # the maximum number of iterations are exceeded
@@ -171,79 +248,74 @@ class Play:
             colin_action = self.best_response(game, "player_2", rowena_strategy/i)
 
             # Update the players action counters
-            rowena_strategy += rowena_action
-            colin_strategy += colin_action
-
-            # Update the last `W` empirical mixed strategies
-            # Pop the leftmost element only after `self.W` many iterations
-            # Because the deque does not contain a history of `self.W` many elements until then
-            if i > self.W:
-                _ = rowena_deque.popleft()
-                _ = colin_deque.popleft()
+            # The counters track how often the first action (action 0) was played
+            rowena_strategy += 1 - rowena_action
+            colin_strategy += 1 - colin_action
+
             # Divide by the counters by i+1 because index i is initialized to 1,
             # but this loop begins at the second iteration of the fictitious play
-            rowena_deque.append(rowena_strategy/(i+1))
-            colin_deque.append(colin_strategy/(i+1))
+            rowena_p = rowena_strategy/(i+1)
+            colin_p = colin_strategy/(i+1)
 
             # Store their latest empirical mixed strategy
-            rowena_list.append(rowena_strategy/(i+1))
-            colin_list.append(colin_strategy/(i+1))
+            if record:
+                rowena_list.append(rowena_p)
+                colin_list.append(colin_p)
 
             # Check if convergence criteria is met 
-            # Only start checking once the deque's are filled
-            # Otherwise the game trivially converges when the deques contain a single element 
-            if (i > self.W) and (max(rowena_deque) - min(rowena_deque) < self.epsilon) and (max(colin_deque) - min(colin_deque) < self.epsilon):
-                # Create a list of the iterations
-                iteration_list = list(range(i+1))
-                
-                # Check the the lengths of the lists to be saved are the same
-                if (len(iteration_list) != len(rowena_list)) or (len(rowena_list) != len(colin_list)):
-                    raise AssertionError(f"""Expected all lists to be of the same length but got 
-                                         len(iteration_list)={len(iteration_list)}, len(rowena_list))={len(rowena_list)},
-                                         len(colin_list)={len(colin_list)}.""")
-                
-                # Quit fictitious play and write the empirical mixed strategies to the output file
-                df = pd.DataFrame({
-                    'iteration': iteration_list,
-                    'game_id': [game_id for _ in range(i+1)],
-                    'game': [game.to_list() for _ in range(i+1)],
-                    'seed': [self.seed for _ in range(i+1)],
-                    'max_iteration': self.max_iterations,
-                    'epsilon': self.epsilon,
-                    'window_size': self.W,
-                    'rowena_probabilities': rowena_list,
-                    'colin_probabilities': colin_list
-                })
-                # Create a new parquet file for each game_id
-                output_file = f"{self.output_file.split('.parquet')[0]}_game_{game_id}.parquet"
-                df.to_parquet(output_file, compression="snappy")
-
-                # Return `None` to ensure the same format as `self.run_fictitious_play` 
-                return None, None, None
-
-                     
+            if criterion.update(i, rowena_p, colin_p, rowena_action, colin_action):
+                return CONVERGED, i+1, rowena_strategy, colin_strategy, rowena_list, colin_list
+
+            if i == next_checkpoint:
+                # Stop once the remaining iterations provably cannot meet the convergence criteria
+                if i == next_bound_check:
+                    next_bound_check += self.W
+                    if criterion.cannot_converge(i+1, rowena_strategy, colin_strategy, self.max_iterations):
+                        return CANNOT_CONVERGE, i+1, rowena_strategy, colin_strategy, rowena_list, colin_list
 
+                if i == next_report:
+                    next_report += report_every
+                    self.progress.iteration(game_id, i, rowena_p, colin_p)
+
+                next_checkpoint = min(next_bound_check, next_report)
 
         # If the loop terminates without returning it must be because the maximum number
         # of iterations were exceeded
-        iteration_list = list(range(i+1))
-        df = pd.DataFrame({
+        return DID_NOT_CONVERGE, self.max_iterations, rowena_strategy, colin_strategy, rowena_list, colin_list
+
+    def _play_compiled(self, game, record):
+        # Same as `_play` without the iteration events, with the loop running in `kernels.play_window`
+        a_0, b_0 = self.first_actions(self.seed)
+        rowena_strategy = 1 if a_0 == 0 else 0
+        colin_strategy = 1 if b_0 == 0 else 0
+
+        criterion = self.criterion
+        check_bound = self.early_termination and criterion.can_prove_non_convergence(self.max_iterations)
+        status, plays, rowena_strategy, colin_strategy, rowena_list, colin_list = kernels.play_window(
+            np.array(list(game.game["player_1"].values()), dtype=float), rowena_strategy, colin_strategy,
+            self.max_iterations, self.W, self.epsilon, criterion._bound(self.max_iterations), check_bound, record)
+
+        if record:
+            rowena_list, colin_list = rowena_list[:plays], colin_list[:plays]
+        else:
+            rowena_list = colin_list = None
+        return KERNEL_STATUSES[status], plays, int(rowena_strategy), int(colin_strategy), rowena_list, colin_list
+
+    def _trajectory_dataframe(self, game, game_id, iteration_list, rowena_list, colin_list, status):
+        n = len(iteration_list)
+        return pd.DataFrame({
             'iteration': iteration_list,
-            'game_id': [game_id for _ in range(i+1)],
-            'game': [game.to_list() for _ in range(i+1)],
-            'seed': [self.seed for _ in range(i+1)],
+            'game_id': [game_id for _ in range(n)],
+            'game': [game.to_list() for _ in range(n)],
+            'seed': [self.seed for _ in range(n)],
             'max_iteration': self.max_iterations,
             'epsilon': self.epsilon,
             'window_size': self.W,
             'rowena_probabilities': rowena_list,
-            'colin_probabilities': colin_list
+            'colin_probabilities': colin_list,
+            'status': status,
+            'mode': "classic"
         })
-        # Create a new parquet file for each game_id
-        output_file = f"{self.output_file.split('.parquet')[0]}_game_{game_id}.parquet"
-        df.to_parquet(output_file, compression="snappy")
-
-        # Return `None` to ensure the same format as `self.run_fictitious_play` 
-        return None, None, None
 
 
 # Example usage, running one fictitious play:
@@ -263,9 +335,11 @@ if __name__ == "__main__":
     # 10 times larger than the value of epsilon. 
     epsilon = 1e-3
     max_iterations = 10**4
-    fictitious_play = Play(max_iterations=max_iterations, epsilon=epsilon, seed=seed)
+    # Report the empirical mixed strategies ten times during the play
+    progress = ProgressReporter(verbosity=ITERATION, min_interval=0)
+    fictitious_play = Play(max_iterations=max_iterations, epsilon=epsilon, seed=seed, backend="python", progress=progress)
     # Run the fictitious play
-    rowena_actions, colin_actions, iteration = fictitious_play.run_fictitious_play(game)
+    rowena_actions, colin_actions, iteration = fictitious_play.run_fictitious_play(game, game_id=0)
 
     # Analyze the output
     if isinstance(rowena_actions, str):
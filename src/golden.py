@@ -0,0 +1,238 @@
+""" Golden-dataset regression harness: every engine backend has to reproduce the stored reference results. """
+
+import json
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from arbitrary_games import Game
+from fictitious_play import Play, SADDLE_POINT
+from batch_play import BatchPlay
+from dataset import read_trajectories
+from pipeline import SweepPipeline
+from seeds import game_seeds
+import kernels
+
+# The reference, written by `python src/golden.py --update` with the reference implementation (`Play` with the
+# python backend). Only regenerate it for changes that are meant to change results, and say so in the commit
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "golden", "reference.json")
+
+# The games of the reference: `NUMBER_OF_GAMES` games of the sweep with seed `SWEEP_SEED`, see `seeds.game_seeds`,
+# played with every configuration
+SWEEP_SEED = 20240601
+NUMBER_OF_GAMES = 200
+CONFIGURATIONS = [
+    dict(max_iterations=2000, window_size=10, epsilon=1e-3),
+    dict(max_iterations=10**4, window_size=10, epsilon=1e-4),
+    dict(max_iterations=5000, window_size=50, epsilon=1e-3, early_termination=False)
+]
+
+# The trajectories of this many games (the first ones without a saddle point) are stored at `sampled_iterations`
+SAMPLED_GAMES = 10
+
+SUMMARY_COLUMNS = ["game_id", "status", "iterations", "rowena_probability", "colin_probability"]
+
+
+def sampled_iterations(plays):
+    """ The iterations of a trajectory of `plays` iterations that are compared: the first ten, powers of two and the last. """
+    iterations = set(range(min(plays, 10))) | {2**k for k in range(plays.bit_length()) if 2**k < plays} | {plays - 1}
+    return sorted(iterations)
+
+
+def summarize_trajectories(df):
+    """ One row per game of a trajectory DataFrame (see `Play.simulate_trajectory`), as returned by `BatchPlay.run`. """
+    df = df.sort_values(["game_id", "iteration"])
+    summary = df.groupby("game_id", sort=True).agg(status=("status", "first"), iterations=("iteration", "size"),
+                                                   rowena_probability=("rowena_probabilities", "last"),
+                                                   colin_probability=("colin_probabilities", "last")).reset_index()
+    # A saddle point is recorded as a single iteration holding its limit, but played for 0 iterations
+    summary.loc[summary["status"] == SADDLE_POINT, "iterations"] = 0
+    return summary[SUMMARY_COLUMNS]
+
+
+# Engines under test. Each plays the games with a configuration and returns the summary (one row per game, see
+# `SUMMARY_COLUMNS`) and the trajectories in the format of `Play.simulate_trajectory`, or `None` if it records none
+
+def _play_engine(backend, threads=None):
+    def play(configuration, games, game_ids, seeds):
+        simulate = lambda k: Play(seed=seeds[k], backend=backend, **configuration).simulate_trajectory(games[k], game_ids[k])
+        if threads is None:
+            frames = [simulate(k) for k in range(len(games))]
+        else:
+            # Games played concurrently must not share any random state
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                frames = list(executor.map(simulate, range(len(games))))
+        trajectories = pd.concat(frames, ignore_index=True)
+        return summarize_trajectories(trajectories), trajectories
+    return play
+
+
+def _batch_engine(configuration, games, game_ids, seeds):
+    batch_play = BatchPlay(batch_size=64, **configuration)
+    trajectories = batch_play.simulate_trajectories(games, game_ids, seeds)
+    # The summaries of `run` are compared too, it plays without recording
+    return batch_play.run(games, game_ids, seeds)[SUMMARY_COLUMNS], trajectories
+
+
+def _deduplicated_engine(configuration, games, game_ids, seeds):
+    return BatchPlay(deduplicate="exact", **configuration).run(games, game_ids, seeds)[SUMMARY_COLUMNS], None
+
+
+def _pipeline_engine(output):
+    def play(configuration, games, game_ids, seeds):
+        # Through the whole write path, the trajectories are read back (and rebuilt from the switches) from a
+        # throwaway dataset
+        with tempfile.TemporaryDirectory() as dataset_dir:
+            SweepPipeline(BatchPlay(**configuration), dataset_dir, "golden", memory_budget=1024**3,
+                          output=output).run(games, game_ids, seeds)
+            trajectories = read_trajectories(dataset_dir, columns=["iteration", "game_id", "rowena_probabilities",
+                                                                   "colin_probabilities", "status"])
+        return summarize_trajectories(trajectories), trajectories
+    return play
+
+
+ENGINES = {
+    "play_python": _play_engine("python"),
+    "play_numba": _play_engine("numba", threads=4),
+    "batch": _batch_engine,
+    "batch_deduplicated": _deduplicated_engine,
+    "pipeline": _pipeline_engine("trajectories"),
+    "pipeline_switches": _pipeline_engine("switches")
+}
+# The engine that writes the reference
+REFERENCE_ENGINE = "play_python"
+
+
+def _inputs(sweep_seed, number_of_games):
+    seeds = game_seeds(sweep_seed, number_of_games)
+    return [Game(seed=seed) for seed in seeds], list(range(number_of_games)), seeds
+
+
+def _record(configuration, summary, trajectories, game_ids=None):
+    # The reference entry of a configuration, `game_ids` are the games whose trajectories are stored
+    if game_ids is None:
+        game_ids = summary.loc[summary["status"] != SADDLE_POINT, "game_id"].head(SAMPLED_GAMES).tolist()
+    record = {
+        "configuration": configuration,
+        "statistics": {
+            "status": summary["status"].value_counts().sort_index().to_dict(),
+            "mean_iterations": float(summary["iterations"].mean()),
+            "mean_rowena_probability": float(summary["rowena_probability"].mean()),
+            "mean_colin_probability": float(summary["colin_probability"].mean())
+        },
+        "games": [[int(game_id), status, int(iterations), float(p), float(q)]
+                  for game_id, status, iterations, p, q in summary[SUMMARY_COLUMNS].itertuples(index=False)],
+        "trajectories": {}
+    }
+    if trajectories is not None:
+        for game_id, trajectory in trajectories[trajectories["game_id"].isin(game_ids)].groupby("game_id"):
+            trajectory = trajectory.sort_values("iteration")
+            rowena, colin = trajectory["rowena_probabilities"].to_numpy(), trajectory["colin_probabilities"].to_numpy()
+            record["trajectories"][str(game_id)] = [[k, float(rowena[k]), float(colin[k])]
+                                                    for k in sampled_iterations(len(trajectory))]
+    return record
+
+
+def generate(sweep_seed=SWEEP_SEED, number_of_games=NUMBER_OF_GAMES, configurations=CONFIGURATIONS):
+    """ The reference results of the reference engine, as stored in `GOLDEN_FILE`. """
+    games, game_ids, seeds = _inputs(sweep_seed, number_of_games)
+    records = [_record(configuration, *ENGINES[REFERENCE_ENGINE](configuration, games, game_ids, seeds))
+               for configuration in configurations]
+    return {"sweep_seed": sweep_seed, "number_of_games": number_of_games, "engine": REFERENCE_ENGINE,
+            "configurations": records}
+
+
+def _compare(expected, actual, tolerance, path=""):
+    # The differences between two JSON-like values, numbers may differ by `tolerance`
+    if isinstance(expected, dict) and isinstance(actual, dict):
+        differences = ([f"{path}/{key}: missing" for key in expected if key not in actual]
+                       + [f"{path}/{key}: unexpected" for key in actual if key not in expected])
+        for key in expected:
+            if key in actual:
+                differences += _compare(expected[key], actual[key], tolerance, f"{path}/{key}")
+        return differences
+    if isinstance(expected, list) and isinstance(actual, list):
+        if len(expected) != len(actual):
+            return [f"{path}: expected {len(expected)} entries but got {len(actual)}"]
+        return [difference for k, (e, a) in enumerate(zip(expected, actual))
+                for difference in _compare(e, a, tolerance, f"{path}/{k}")]
+    if isinstance(expected, float) and isinstance(actual, (int, float)):
+        if abs(expected - actual) > tolerance or np.isnan(actual):
+            return [f"{path}: expected {expected!r} but got {actual!r}"]
+        return []
+    return [] if expected == actual else [f"{path}: expected {expected!r} but got {actual!r}"]
+
+
+def check(reference, engines=None, tolerance=0.0):
+    """
+    Play the reference games with every engine in `engines` (by default all of them) and compare the summary
+    statistics, every game's summary and the sampled trajectories with the reference.
+
+        Every engine is expected to reproduce the reference bit for bit, `tolerance` allows for differences in
+        the probabilities. Engines that record no trajectories are only compared on the summaries.
+
+    Returns a dict of engine name to the list of differences, `None` for engines that cannot run here.
+    """
+    games, game_ids, seeds = _inputs(reference["sweep_seed"], reference["number_of_games"])
+    differences = {}
+    for name in engines or ENGINES:
+        if name == "play_numba" and not kernels.NUMBA_AVAILABLE:
+            differences[name] = None
+            continue
+        differences[name] = []
+        for k, expected in enumerate(reference["configurations"]):
+            summary, trajectories = ENGINES[name](expected["configuration"], games, game_ids, seeds)
+            actual = _record(expected["configuration"], summary, trajectories,
+                             game_ids=[int(game_id) for game_id in expected["trajectories"]])
+            if trajectories is None:
+                actual["trajectories"] = expected["trajectories"]
+            differences[name] += [f"configuration {k}{difference}" for difference in _compare(expected, actual, tolerance)]
+    return differences
+
+
+def load(path=GOLDEN_FILE):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(reference, path=GOLDEN_FILE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(reference, f, indent=1)
+        f.write("\n")
+
+
+# Example usage, checking every engine against the reference (run from the repository root). Exits with an error
+# if any engine deviates, so it can run as a regression gate:
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Check the fictitious play engines against the golden reference")
+    parser.add_argument("--update", action="store_true",
+                        help=f"Regenerate the reference with the {REFERENCE_ENGINE} engine instead of checking.")
+    parser.add_argument("--engine", type=str, action="append", choices=sorted(ENGINES),
+                        help="Only check these engines (can be given several times).")
+    parser.add_argument("--tolerance", type=float, default=0.0, help="Allowed difference of the probabilities.")
+    args = parser.parse_args()
+
+    if args.update:
+        save(generate())
+        print(f"Wrote the reference to {os.path.normpath(GOLDEN_FILE)}")
+        sys.exit(0)
+
+    failed = False
+    for name, engine_differences in check(load(), args.engine, args.tolerance).items():
+        if engine_differences is None:
+            print(f"{name:>20}: skipped, not available")
+        elif not engine_differences:
+            print(f"{name:>20}: identical")
+        else:
+            failed = True
+            print(f"{name:>20}: {len(engine_differences)} differences")
+            for difference in engine_differences[:10]:
+                print(f"{'':>22}{difference}")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,154 @@
+""" Compiled (numba) kernels for the per-iteration loop of `Play`, used when numba is installed. """
+
+import numpy as np
+
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+    # Keep the kernels importable (and runnable, slowly) without numba
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda function: function
+
+# Status codes returned by the kernels, see `fictitious_play.py` for their meaning
+KERNEL_CONVERGED = 0
+KERNEL_DID_NOT_CONVERGE = 1
+KERNEL_CANNOT_CONVERGE = 2
+
+
+@njit(cache=True)
+def _push_window(j, full, W, rowena_p, colin_p, blocks, suffix_max, suffix_min, prefix_max, prefix_min, ranges):
+    # Same van Herk/Gil-Werman update as `convergence.WindowedRange`, for both players at once.
+    # Row 0 of every array belongs to Rowena, row 1 to Colin. Returns the next position in the block and
+    # whether a full block has been seen, and writes the window ranges to `ranges`
+    blocks[0, j] = rowena_p
+    blocks[1, j] = colin_p
+    for player in range(2):
+        value = blocks[player, j]
+        if j == 0:
+            prefix_max[player] = value
+            prefix_min[player] = value
+        else:
+            prefix_max[player] = max(prefix_max[player], value)
+            prefix_min[player] = min(prefix_min[player], value)
+
+    if j == W - 1:
+        # The window is exactly the completed block, which becomes the previous block
+        for player in range(2):
+            ranges[player] = prefix_max[player] - prefix_min[player]
+            running_max = blocks[player, W - 1]
+            running_min = running_max
+            suffix_max[player, W - 1] = running_max
+            suffix_min[player, W - 1] = running_min
+            for k in range(W - 2, -1, -1):
+                running_max = max(running_max, blocks[player, k])
+                running_min = min(running_min, blocks[player, k])
+                suffix_max[player, k] = running_max
+                suffix_min[player, k] = running_min
+        return 0, True
+
+    for player in range(2):
+        if full:
+            ranges[player] = (max(suffix_max[player, j + 1], prefix_max[player])
+                              - min(suffix_min[player, j + 1], prefix_min[player]))
+        else:
+            ranges[player] = prefix_max[player] - prefix_min[player]
+    return j + 1, full
+
+
+@njit(cache=True)
+def play_window(utilities, rowena_count, colin_count, max_plays, W, epsilon, bound, check_bound, record):
+    """
+    Classic fictitious play with the window criterion, mirroring `Play._play` operation for operation.
+
+        `utilities` are Rowena's (a, b, c, d), the counters are the first-action counts after the first play.
+        The cannot-converge bound of `WindowedRange` is checked every `W` iterations when `check_bound` is set.
+
+    Returns (status code, plays, rowena_count, colin_count, rowena_trajectory, colin_trajectory), where the
+    trajectories hold the empirical mixed strategies of the first `plays` iterations if `record` is set.
+    """
+    a, b, c, d = utilities[0], utilities[1], utilities[2], utilities[3]
+    # Colin's utilities are the negation of Rowena's
+    neg_a, neg_b, neg_c, neg_d = -a, -b, -c, -d
+
+    size = max_plays if record else 1
+    rowena_trajectory = np.empty(size)
+    colin_trajectory = np.empty(size)
+    rowena_trajectory[0] = rowena_count / 1
+    colin_trajectory[0] = colin_count / 1
+
+    blocks = np.empty((2, W))
+    suffix_max = np.empty((2, W))
+    suffix_min = np.empty((2, W))
+    prefix_max = np.empty(2)
+    prefix_min = np.empty(2)
+    ranges = np.empty(2)
+    j, full = _push_window(0, False, W, rowena_count / 1, colin_count / 1, blocks, suffix_max, suffix_min,
+                           prefix_max, prefix_min, ranges)
+
+    next_bound_check = W if check_bound else max_plays
+    for i in range(1, max_plays):
+        # Best responses to the opponent's latest empirical mixed strategy, ties go to the first action
+        colin_p = colin_count / i
+        rowena_p = rowena_count / i
+        rowena_action = 0 if (a * colin_p) + (b * (1 - colin_p)) >= (c * colin_p) + (d * (1 - colin_p)) else 1
+        colin_action = 0 if (neg_a * rowena_p) + (neg_c * (1 - rowena_p)) >= (neg_b * rowena_p) + (neg_d * (1 - rowena_p)) else 1
+
+        # The counters track how often the first action (action 0) was played
+        rowena_count += 1 - rowena_action
+        colin_count += 1 - colin_action
+        rowena_p = rowena_count / (i + 1)
+        colin_p = colin_count / (i + 1)
+
+        if record:
+            rowena_trajectory[i] = rowena_p
+            colin_trajectory[i] = colin_p
+
+        j, full = _push_window(j, full, W, rowena_p, colin_p, blocks, suffix_max, suffix_min,
+                               prefix_max, prefix_min, ranges)
+        if i > W and ranges[0] < epsilon and ranges[1] < epsilon:
+            return KERNEL_CONVERGED, i + 1, rowena_count, colin_count, rowena_trajectory, colin_trajectory
+
+        if i == next_bound_check:
+            next_bound_check += W
+            plays = i + 1
+            if min(rowena_count, plays - rowena_count) >= bound or min(colin_count, plays - colin_count) >= bound:
+                return KERNEL_CANNOT_CONVERGE, plays, rowena_count, colin_count, rowena_trajectory, colin_trajectory
+
+    return KERNEL_DID_NOT_CONVERGE, max_plays, rowena_count, colin_count, rowena_trajectory, colin_trajectory
+
+
+def check_equivalence(number_of_games=200, **play_kwargs):
+    """
+    Play the same games with the Python and the compiled backend of `Play` and return the seeds of the games whose
+    outputs (statuses, iterations and every recorded empirical mixed strategy) differ.
+    """
+    import random
+    from arbitrary_games import Game
+    from fictitious_play import Play
+
+    mismatches = []
+    for seed in random.sample(range(10**9), number_of_games):
+        game = Game(seed=seed)
+        python_play = Play(seed=seed, backend="python", **play_kwargs)
+        compiled_play = Play(seed=seed, backend="numba", **play_kwargs)
+        if (python_play.run_fictitious_play(game) != compiled_play.run_fictitious_play(game)
+                or not python_play.simulate_trajectory(game, 0).equals(compiled_play.simulate_trajectory(game, 0))):
+            mismatches.append(seed)
+    return mismatches
+
+
+# Example usage, checking that the compiled kernel reproduces the reference implementation:
+if __name__ == "__main__":
+    if not NUMBA_AVAILABLE:
+        print("numba is not installed, `Play` uses the pure Python implementation")
+    else:
+        for play_kwargs in [dict(max_iterations=10**4, epsilon=1e-4),
+                            dict(max_iterations=10**4, epsilon=1e-7, window_size=5),
+                            dict(max_iterations=10**3, epsilon=1e-3, window_size=1, early_termination=False)]:
+            mismatches = check_equivalence(**play_kwargs)
+            print(f"{play_kwargs}: {'identical' if not mismatches else f'{len(mismatches)} mismatches, seeds {mismatches}'}")
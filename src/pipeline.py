@@ -0,0 +1,228 @@
+""" Memory-bounded sweep pipeline: simulation, encoding and writing run concurrently with bounded queues in between. """
+
+import queue
+import threading
+
+import numpy as np
+
+from dataset import OUTPUTS, SWITCHES_DIR, TRAJECTORIES_DIR, PartitionWriter
+from equilibrium import add_convergence_metrics
+
+# Memory of one recorded iteration of one game as simulated: both players' empirical mixed strategies as float64
+RAW_BYTES_PER_ROW = 16
+
+# Upper bound on the memory of one recorded iteration of one game once encoded: the DataFrame with its convergence
+# metrics, and the Arrow copy made while it is written. Measured at about 300 bytes, plus headroom for Arrow's buffers
+BYTES_PER_ROW = 512
+
+# Marks the end of the batches in a queue
+_DONE = object()
+
+
+class SweepPipeline:
+    """
+    Play a sweep and write its trajectories to the dataset, holding at most `memory_budget` bytes of trajectories.
+
+        The stages run concurrently and hand work to each other through queues of `queue_size` items:
+
+            simulation (calling thread)  ->  encoding (thread)  ->  writing (thread)
+
+        The simulation plays `batch_size` games at a time. Encoding splits every simulated batch into slices of at
+        most `slice_rows` recorded iterations and turns each into the DataFrame of `BatchPlay.trajectory_dataframe`
+        with the convergence metrics of `equilibrium.add_convergence_metrics`, writing appends every slice to the
+        batch's file in the sweep's partition as row groups, so a sweep has one file per batch. A full queue blocks
+        the stage before it, so the simulation never runs ahead of the writer by more than the queues hold and disk
+        I/O overlaps with the simulation of the next batches.
+
+        Simulated batches are held as arrays (`RAW_BYTES_PER_ROW`), by the simulation (twice while it trims its
+        recording), the encoding queue and the encoder, and are assumed to record all `max_iterations` iterations of
+        every game as the simulation cannot know better in advance. Encoded slices (`BYTES_PER_ROW`) are held by the
+        encoder, the writing queue and the writer, and are cut from the iterations the games actually recorded. The
+        simulation keeps the batch engine's batch size, which only shrinks if its arrays alone would not leave room
+        for slices of a single game, and the slices are as large as the rest of the budget allows.
+
+        With `output="switches"` only the iterations at which the players switch actions are recorded and written
+        (see `switches.py`), without convergence metrics. Their memory does not grow with the number of iterations, the
+        batches are then written whole.
+    """
+
+    def __init__(self, batch_play, dataset_dir, sweep_id, memory_budget=2 * 1024**3, queue_size=2, on_written=None,
+                 output=TRAJECTORIES_DIR):
+        if output not in OUTPUTS:
+            raise ValueError(f"Expected output to be one of {OUTPUTS} but got output={output}")
+        self.batch_play = batch_play
+        self.dataset_dir = dataset_dir
+        self.sweep_id = sweep_id
+        self.memory_budget = memory_budget
+        self.queue_size = queue_size
+        # Called from the writer thread with the number of games of every slice written
+        self.on_written = on_written
+        self.output = output
+        self._error = None
+        self._stop = threading.Event()
+        # Number of the next batch encoded, every batch is written as file number `part`
+        self._part = 0
+        # The writer of the file of the batch being written, only used by the writer thread
+        self._writer = None
+
+    @property
+    def batch_size(self):
+        """ The number of games simulated at once. """
+        if self.output == SWITCHES_DIR:
+            return self.batch_play.batch_size
+        # Leave room for slices of a single game
+        available = self.memory_budget - self._slices_in_flight * self._encoded_bytes_per_game
+        batch_size = min(self.batch_play.batch_size, available // (self._batches_in_flight * self._raw_bytes_per_game))
+        if batch_size < 1:
+            needed = (self._batches_in_flight * self._raw_bytes_per_game
+                      + self._slices_in_flight * self._encoded_bytes_per_game)
+            raise ValueError(f"A memory budget of {self.memory_budget} bytes does not fit a single game of "
+                             f"{self.batch_play.max_iterations} iterations, it needs at least {needed} bytes")
+        return batch_size
+
+    @property
+    def slice_rows(self):
+        """ The number of recorded iterations encoded and written at once, a slice holds at least one game. """
+        available = self.memory_budget - self._batches_in_flight * self.batch_size * self._raw_bytes_per_game
+        return max(self.batch_play.max_iterations, available // (self._slices_in_flight * BYTES_PER_ROW))
+
+    def _slices(self, result):
+        # The (start, end) games of the slices of a batch, each as many games as fit in `slice_rows` recorded iterations
+        number_of_games = len(result["status"])
+        if self.output == SWITCHES_DIR:
+            return [(0, number_of_games)]
+        # A saddle point records one iteration
+        rows = np.maximum(result["plays"], 1)
+        slice_rows = self.slice_rows
+        slices, start, total = [], 0, 0
+        for g in range(number_of_games):
+            if g > start and total + rows[g] > slice_rows:
+                slices.append((start, g))
+                start, total = g, 0
+            total += rows[g]
+        return slices + [(start, number_of_games)] if number_of_games else slices
+
+    @property
+    def _batches_in_flight(self):
+        # Two in the simulation while it trims its recording, `queue_size` in the encoding queue, one in the encoder
+        return 3 + self.queue_size
+
+    @property
+    def _slices_in_flight(self):
+        # One the encoder waits to pass on, `queue_size` in the writing queue, one in the writer
+        return 2 + self.queue_size
+
+    @property
+    def _raw_bytes_per_game(self):
+        return self.batch_play.max_iterations * RAW_BYTES_PER_ROW
+
+    @property
+    def _encoded_bytes_per_game(self):
+        return self.batch_play.max_iterations * BYTES_PER_ROW
+
+    def run(self, games, game_ids, seeds):
+        """ Play the games and write their trajectories, returns once everything is written. """
+        self._part = 0
+        encode_queue = queue.Queue(maxsize=self.queue_size)
+        write_queue = queue.Queue(maxsize=self.queue_size)
+        threads = [
+            threading.Thread(target=self._stage, args=(encode_queue, write_queue, self._encode), name="sweep-encoder", daemon=True),
+            threading.Thread(target=self._stage, args=(write_queue, None, self._write), name="sweep-writer", daemon=True)
+        ]
+        for thread in threads:
+            thread.start()
+
+        self._writer = None
+        try:
+            batches = self.batch_play.simulate_batches(games, game_ids, seeds, batch_size=self.batch_size,
+                                                       record="switches" if self.output == SWITCHES_DIR else True)
+            for start, end, result in batches:
+                if self._stop.is_set():
+                    break
+                self._put(encode_queue, (games[start:end], game_ids[start:end], seeds[start:end], result))
+                # Drop the reference, the batch now belongs to the encoder
+                result = None
+        except BaseException:
+            self._stop.set()
+            raise
+        finally:
+            # The end marker is always sent, so the threads finish even when the simulation failed
+            self._put(encode_queue, _DONE)
+            for thread in threads:
+                thread.join()
+            # The file of the last batch, the writer thread is done with it
+            if self._writer is not None:
+                if self._error is None and not self._stop.is_set():
+                    self._writer.close()
+                else:
+                    self._writer.abort()
+                self._writer = None
+
+        if self._error is not None:
+            raise self._error
+
+    def _encode(self, item):
+        # Yields the slices of a batch one at a time, so only one of them is encoded while the writer is behind
+        games, game_ids, seeds, result = item
+        part = self._part
+        self._part += 1
+        for start, end in self._slices(result):
+            if self._stop.is_set():
+                return
+            piece = {key: values[start:end] for key, values in result.items() if key not in ("trajectories", "switches")}
+            if self.output == SWITCHES_DIR:
+                piece["switches"] = [player_switches[start:end] for player_switches in result["switches"]]
+                df = self.batch_play.switches_dataframe(games[start:end], game_ids[start:end], seeds[start:end], piece)
+            else:
+                piece["trajectories"] = result["trajectories"][:, :, start:end]
+                df = self.batch_play.trajectory_dataframe(games[start:end], game_ids[start:end], seeds[start:end], piece)
+                # Solve every game analytically and add the distance to equilibrium and exploitability of every iteration
+                df = add_convergence_metrics(df)
+            yield part, end - start, df
+            df = None
+
+    def _write(self, item):
+        part, number_of_games, df = item
+        # The first slice of a batch completes the file of the batch before
+        if self._writer is not None and self._writer.part != part:
+            self._writer.close()
+            self._writer = None
+        if self._writer is None:
+            self._writer = PartitionWriter(self.dataset_dir, self.sweep_id, part, self.output)
+        self._writer.write(df)
+        if self.on_written is not None:
+            self.on_written(number_of_games)
+
+    def _stage(self, source, destination, work):
+        # Process batches until the end marker, then pass it on. After an error the remaining batches are drained
+        # without processing, so the stages before this one never block on a full queue
+        while True:
+            item = source.get()
+            if item is _DONE:
+                break
+            if self._stop.is_set():
+                continue
+            try:
+                # The encoder yields several outputs per item, the writer none
+                outputs = work(item)
+                item = None
+                for output in outputs or ():
+                    self._put(destination, output)
+                    output = None
+            except BaseException as e:
+                self._error = self._error or e
+                self._stop.set()
+                continue
+            outputs = None
+        if destination is not None:
+            destination.put(_DONE)
+
+    def _put(self, destination, item):
+        # Block until there is room, but give up once another stage failed
+        while True:
+            try:
+                destination.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if self._stop.is_set() and item is not _DONE:
+                    return
@@ -0,0 +1,109 @@
+""" Progress reporting for fictitious plays and sweeps, kept out of the per-iteration loop. """
+
+import time
+
+# Verbosity levels of a `ProgressReporter`, every level includes the events of the levels below it
+QUIET = 0
+# Aggregated progress of the sweep: games completed so far and their statuses
+SWEEP = 1
+# Also every finished game, with its status and number of plays
+GAME = 2
+# Also the empirical mixed strategies of every game, `checkpoints` times per game
+ITERATION = 3
+
+
+class ProgressEvent:
+    """ A progress update, `kind` is one of "iteration", "game" or "sweep" and only the matching fields are set. """
+
+    def __init__(self, kind, game_id=None, iteration=None, rowena_p=None, colin_p=None, status=None, plays=None,
+                 completed=None, total=None, status_counts=None, elapsed=None):
+        self.kind = kind
+        self.game_id = game_id
+        self.iteration = iteration
+        self.rowena_p = rowena_p
+        self.colin_p = colin_p
+        self.status = status
+        self.plays = plays
+        self.completed = completed
+        self.total = total
+        self.status_counts = status_counts
+        self.elapsed = elapsed
+
+    def __str__(self):
+        if self.kind == "iteration":
+            return (f"Game {self.game_id}, iteration {self.iteration}: empirical mixed strategies "
+                    f"(Rowena, Colin) = ({self.rowena_p:.4f}, {self.colin_p:.4f})")
+        if self.kind == "game":
+            return f"Game {self.game_id}: {self.status} after {self.plays} plays"
+        total = f"/{self.total}" if self.total else ""
+        counts = ", ".join(f"{count} {status}" for status, count in sorted(self.status_counts.items()))
+        return f"{self.completed}{total} games in {self.elapsed:.1f}s ({counts})"
+
+
+class ProgressReporter:
+    """
+    Collects the progress of fictitious plays and passes rate-limited `ProgressEvent`s to `callback`.
+
+        `Play` and `BatchPlay` only call the reporter between iterations at a few checkpoints and once per finished
+        game, so the per-iteration loop does no formatting or I/O. The reporter aggregates the finished games into
+        sweep events, and at most one event of each kind is emitted every `min_interval` seconds (the final sweep
+        event of `finish` is always emitted). The default callback prints the events, pass e.g.
+        `callback=lambda event: tqdm.write(str(event))` to print them above a progress bar.
+
+        Iteration events are only emitted by `Play`'s Python backend, the compiled and batch engines report
+        finished games only.
+    """
+
+    def __init__(self, verbosity=SWEEP, min_interval=1.0, callback=None, checkpoints=10):
+        self.verbosity = verbosity
+        self.min_interval = min_interval
+        self.callback = callback if callback is not None else print
+        self.checkpoints = checkpoints
+        self.start()
+
+    def start(self, total=None):
+        """ Reset the aggregated counts for a new sweep of `total` games. """
+        self.total = total
+        self.completed = 0
+        self.status_counts = {}
+        self.started = time.monotonic()
+        self._last_emitted = {}
+
+    def iteration_interval(self, max_iterations):
+        """ Every how many iterations a game should call `iteration`, or `None` when iteration events are not wanted. """
+        if self.verbosity < ITERATION:
+            return None
+        return max(1, max_iterations // self.checkpoints)
+
+    def iteration(self, game_id, iteration, rowena_p, colin_p):
+        self._emit(ProgressEvent("iteration", game_id=game_id, iteration=iteration, rowena_p=rowena_p, colin_p=colin_p))
+
+    def game_done(self, game_id, status, plays):
+        self.games_done([game_id], [status], [plays])
+
+    def games_done(self, game_ids, statuses, plays):
+        """ Record a number of finished games at once, e.g. a batch of `BatchPlay`. """
+        for game_id, status, game_plays in zip(game_ids, statuses, plays):
+            self.completed += 1
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+            if self.verbosity >= GAME:
+                self._emit(ProgressEvent("game", game_id=game_id, status=status, plays=game_plays))
+        if self.verbosity >= SWEEP:
+            self._emit(self._sweep_event())
+
+    def finish(self):
+        """ Emit the final counts of the sweep. """
+        if self.verbosity >= SWEEP:
+            self._emit(self._sweep_event(), force=True)
+
+    def _sweep_event(self):
+        return ProgressEvent("sweep", completed=self.completed, total=self.total, status_counts=dict(self.status_counts),
+                             elapsed=time.monotonic() - self.started)
+
+    def _emit(self, event, force=False):
+        now = time.monotonic()
+        last = self._last_emitted.get(event.kind)
+        if not force and last is not None and now - last < self.min_interval:
+            return
+        self._last_emitted[event.kind] = now
+        self.callback(event)
@@ -0,0 +1,141 @@
+""" SQL over the dataset with an embedded duckdb database, running directly on the Parquet files. """
+
+import os
+
+from dataset import DATASET_DIR, TRAJECTORIES_DIR, SWITCHES_DIR, CATALOG_FILE
+
+# A view of one of the stored outputs with the partition columns `sweep_id`, `epsilon` and `window_size`: every
+# recorded iteration of every game (`trajectories`) or one row per game stored as action switches (`switches`).
+# Files written by different versions may lack some columns, `union_by_name` fills those with NULL
+TRAJECTORIES_SQL = """
+    CREATE VIEW {name} AS
+    SELECT * FROM read_parquet('{path}', hive_partitioning = true, union_by_name = true,
+                               hive_types = {{'sweep_id': VARCHAR, 'epsilon': DOUBLE, 'window_size': BIGINT}})
+"""
+
+# One row per game. `convergence_time` is the last recorded iteration (as in the dashboard's histogram), the
+# probabilities are the final empirical mixed strategies and (a, b, c, d) are Rowena's utilities, see `Game.to_list`.
+# `sign_pattern` writes the signs of (a, b, c, d) as e.g. '+-0+'. The summaries of games stored as trajectories
+# and as action switches (see `switches.py`) are combined
+GAMES_SQL = """
+    CREATE VIEW games AS
+    WITH summaries AS ({summaries})
+    SELECT
+        * EXCLUDE (game),
+        game[1][1] AS a, game[2][1] AS b, game[3][1] AS c, game[4][1] AS d,
+        concat_ws('', sign_symbol(game[1][1]), sign_symbol(game[2][1]), sign_symbol(game[3][1]), sign_symbol(game[4][1])) AS sign_pattern
+    FROM summaries
+"""
+
+TRAJECTORY_SUMMARIES_SQL = """
+        SELECT
+            game_id,
+            any_value(sweep_id) AS sweep_id,
+            any_value(seed) AS seed,
+            any_value(epsilon) AS epsilon,
+            any_value(window_size) AS window_size,
+            any_value(max_iteration) - 1 AS max_iterations,
+            any_value(mode) AS mode,
+            any_value(status) AS status,
+            max(iteration) AS convergence_time,
+            arg_max(rowena_probabilities, iteration) AS rowena_probability,
+            arg_max(colin_probabilities, iteration) AS colin_probability,
+            -- The game is the same on every row of a game. The nested `game` list is still decoded on every row
+            -- scanned, so only queries that use the utilities or `sign_pattern` pay for it, duckdb leaves it out of
+            -- the others
+            any_value(game) FILTER (WHERE iteration = 0) AS game
+        FROM trajectories
+        GROUP BY game_id
+"""
+
+# Games stored as switches already hold one row per game with their final empirical mixed strategies
+SWITCH_SUMMARIES_SQL = """
+        SELECT
+            game_id, sweep_id, seed, epsilon, window_size,
+            max_iteration - 1 AS max_iterations,
+            mode, status,
+            recorded_iterations - 1 AS convergence_time,
+            rowena_probability, colin_probability, game
+        FROM switches
+"""
+
+# Questions that can be asked with `python src/query.py --example <name>`
+EXAMPLE_QUERIES = {
+    "sign_pattern": """
+        SELECT sign_pattern,
+               count(*) AS games,
+               avg((status = 'converged')::INTEGER) AS converged_fraction,
+               median(convergence_time) FILTER (WHERE status = 'converged') AS median_convergence_time,
+               quantile_cont(convergence_time, 0.9) FILTER (WHERE status = 'converged') AS p90_convergence_time
+        FROM games
+        GROUP BY sign_pattern
+        ORDER BY games DESC
+    """,
+    "status": """
+        SELECT sweep_id, epsilon, window_size, status, count(*) AS games, avg(convergence_time) AS mean_convergence_time
+        FROM games
+        GROUP BY ALL
+        ORDER BY ALL
+    """,
+    "sweeps": "SELECT * FROM sweeps ORDER BY created"
+}
+
+
+def connect(root=DATASET_DIR, database=":memory:"):
+    """
+    Open a duckdb connection on the dataset in `root`, with the views
+
+        trajectories:  every recorded iteration, see `dataset.py`
+        switches:      one row per game of the sweeps stored as action switches, see `switches.py`
+        games:         one summary row per game, see `GAMES_SQL`
+        sweeps:        the catalog of sweeps
+
+    Nothing is loaded up front, every query scans only the columns and partitions it needs. Requires duckdb.
+    The trajectories of games stored as switches are not in `trajectories`, rebuild them with `dataset.read_trajectories`.
+    """
+    try:
+        import duckdb
+    except ImportError as e:
+        raise ImportError("Querying the dataset requires duckdb, install it with `pip install duckdb`") from e
+
+    sources = {name: summaries for name, summaries in ((TRAJECTORIES_DIR, TRAJECTORY_SUMMARIES_SQL),
+                                                       (SWITCHES_DIR, SWITCH_SUMMARIES_SQL))
+               if os.path.isdir(os.path.join(root, name))}
+    if not sources:
+        raise FileNotFoundError(f"No trajectories found in {root}, run `python src/run_experiments.py` to create some")
+
+    connection = duckdb.connect(database)
+    connection.execute("""
+        CREATE MACRO sign_symbol(x) AS CASE WHEN x > 0 THEN '+' WHEN x < 0 THEN '-' ELSE '0' END
+    """)
+    for name in sources:
+        path = os.path.join(root, name, "*", "*", "*", "*.parquet").replace("'", "''")
+        connection.execute(TRAJECTORIES_SQL.format(name=name, path=path))
+    connection.execute(GAMES_SQL.format(summaries=" UNION ALL BY NAME ".join(sources.values())))
+    catalog = os.path.join(root, CATALOG_FILE).replace("'", "''")
+    connection.execute(f"CREATE VIEW sweeps AS SELECT * FROM read_parquet('{catalog}')")
+    return connection
+
+
+def query(sql, root=DATASET_DIR, parameters=None):
+    """ Run a single query on the dataset and return the result as a DataFrame, `parameters` fill in `?` or `$name`. """
+    connection = connect(root)
+    try:
+        return connection.execute(sql, parameters).df()
+    finally:
+        connection.close()
+
+
+# Example usage, the convergence time distribution by payoff sign pattern:
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query the fictitious play dataset with SQL")
+    parser.add_argument("--dataset", type=str, default=DATASET_DIR, help="Root directory of the dataset.")
+    parser.add_argument("--example", type=str, default="sign_pattern", choices=sorted(EXAMPLE_QUERIES),
+                        help="Run one of the example queries.")
+    parser.add_argument("--sql", type=str, default=None,
+                        help="Run this query instead, over the views `trajectories`, `switches`, `games` and `sweeps`.")
+    args = parser.parse_args()
+
+    print(query(args.sql or EXAMPLE_QUERIES[args.example], args.dataset).to_string())
@@ -1,15 +1,30 @@
-from random import randint
-import random 
-import os
-import glob
 from tqdm import tqdm
-import pandas as pd
 
 from arbitrary_games import Game
 from fictitious_play import Play
+from batch_play import BatchPlay
+from dataset import DATASET_DIR, new_sweep_id, register_sweep, complete_sweep
+from equilibrium import add_convergence_metrics
+from pipeline import SweepPipeline
+from progress import ProgressReporter, SWEEP
+from seeds import new_sweep_seed, game_seeds
 import subprocess
 
 
+def run_experiment(game_id, seed, max_iterations, window_size, epsilon):
+    """ Play a single game and return its trajectory, used by the dashboard's background workers. """
+    # Load an arbitrary 2x2 zero-sum game
+    game = Game(seed=seed)
+
+    fictitious_play = Play(max_iterations=max_iterations,
+                           window_size=window_size,
+                           epsilon=epsilon,
+                           seed=seed)
+    # With the same convergence metrics as the sweeps of `SweepPipeline`, so every sweep stores the same columns.
+    # Computed in the worker rather than when the sweep is saved, so the cost is spread over the worker pool
+    return add_convergence_metrics(fictitious_play.simulate_trajectory(game, game_id))
+
+
 # See `fictitious_play.py` for more details on how to run a single fictitious game
 # Example usage: 
 if __name__ == "__main__":
@@ -20,36 +35,55 @@ if __name__ == "__main__":
     number_of_experiments = 1000
     epsilon = 1e-4
     max_iterations = 10**5
-    output_parquet = os.path.join("outputs", "mega.parquet")
-
-    # Select random (unique) seeds for every experiment
-    seeds = random.sample(range(10**9), number_of_experiments)
-
-    for i in tqdm(range(number_of_experiments), desc="Fictitious Play Convergence Experiments"):
+    # Fictitious play variant, one of "classic", "alternating", "smoothed" or "weighted" (see `batch_play.py`)
+    mode = "classic"
+    # Number of games played at once by the batch engine
+    batch_size = 256
+    # Memory (in bytes) for the trajectories held by the sweep at any time, the batches are made smaller to fit
+    memory_budget = 2 * 1024**3
+    # How the games are stored: "trajectories" (every iteration, with convergence metrics) or "switches" (only the
+    # iterations at which the players switch actions, orders of magnitude smaller, see `switches.py`). Switches
+    # need the "classic" or "alternating" mode and allow far larger `max_iterations`
+    output = "trajectories"
+    window_size = 10
+    # Every run adds a new sweep to the dataset, see `dataset.py`
+    dataset_dir = DATASET_DIR
+    sweep_id = new_sweep_id()
+    # Every game gets its own seed derived from the sweep seed, set it to the `sweep_seed` of a sweep in the
+    # catalog to play the same games again
+    sweep_seed = new_sweep_seed()
 
-        # Load an arbitrary 2x2 zero-sum game
-        game = Game(seed=seeds[i])
+    # Select a seed for every experiment
+    seeds = game_seeds(sweep_seed, number_of_experiments)
 
-        fictitious_play = Play(max_iterations=max_iterations,
-                            epsilon=epsilon,
-                            output_file=output_parquet,
-                            seed=seeds[i])
+    # Load an arbitrary 2x2 zero-sum game for every experiment
+    games = [Game(seed=seed) for seed in seeds]
 
-        # Run the fictitious play
-        # Ignore the outputs
-        _, _, _ = fictitious_play.run_fictitious_play(game, game_id=i)
+    # Report how many games finished with which status, at most every few seconds and above the progress bar
+    progress = ProgressReporter(verbosity=SWEEP, min_interval=5.0, callback=lambda event: tqdm.write(str(event)))
+    progress.start(number_of_experiments)
 
-    
-    # Combine all parquet files
-    parquet_files = glob.glob(os.path.join("outputs", "*_game_*.parquet"))
-    combined_df = pd.concat([pd.read_parquet(f) for f in parquet_files])
+    # Reserve game ids that follow the games of earlier sweeps
+    first_game_id = register_sweep(dataset_dir, sweep_id, number_of_experiments, epsilon, window_size, max_iterations,
+                                   mode=mode, source="run_experiments", sweep_seed=sweep_seed,
+                                   output=output)
 
-    # Write the final combined file if needed
-    combined_df.to_parquet(output_parquet, compression="snappy")
+    batch_play = BatchPlay(max_iterations=max_iterations,
+                           window_size=window_size,
+                           epsilon=epsilon,
+                           mode=mode,
+                           batch_size=batch_size,
+                           progress=progress)
 
-    # Clean up the temporary parquet files
-    for f in parquet_files:
-        os.remove(f)
+    # Play the games batch by batch and write every batch straight into the sweep's partition, while
+    # the previous batches are encoded and written in background threads
+    with tqdm(total=number_of_experiments, desc="Fictitious Play Convergence Experiments") as progress_bar:
+        pipeline = SweepPipeline(batch_play, dataset_dir, sweep_id, memory_budget=memory_budget,
+                                 on_written=progress_bar.update, output=output)
+        game_ids = list(range(first_game_id, first_game_id + number_of_experiments))
+        pipeline.run(games, game_ids, seeds)
+    progress.finish()
+    complete_sweep(dataset_dir, sweep_id)
 
-    # Run `gui/app.py` to visualize the experiments
-    subprocess.run(["python", "gui/app.py", "--output_file", output_parquet])
+    # Run `gui/app.py` to visualize the experiments of this sweep
+    subprocess.run(["python", "gui/app.py", "--dataset", dataset_dir, "--sweep", sweep_id])
@@ -0,0 +1,39 @@
+""" Independent random streams for every game of a sweep, derived from a single sweep seed. """
+
+import random
+
+import numpy as np
+
+# Sweep seeds are drawn below this bound, so they are stored exactly in the catalog (also as floating point numbers)
+MAX_SWEEP_SEED = 2**32
+
+
+def new_sweep_seed():
+    """ A fresh sweep seed from the operating system's entropy, record it to reproduce the sweep. """
+    return random.SystemRandom().randrange(MAX_SWEEP_SEED)
+
+
+def game_seeds(sweep_seed, number_of_games, first=0):
+    """
+    The seeds of games `first, ..., first + number_of_games - 1` of the sweep with seed `sweep_seed`.
+
+        Game k's seed is derived from the pair (sweep_seed, k) alone, with numpy's `SeedSequence` (child k of
+        `SeedSequence(sweep_seed).spawn`). It does not depend on how many games the sweep has, on the order in which
+        they are played or on any global random state, so a shard, a resumed sweep or a thread playing game k always
+        plays the same game. The seeds are 63 bit, collisions within a sweep are practically impossible.
+
+        Every game draws its utilities and first actions from its own `random.Random(seed)`, see `Game.create_game`
+        and `Play.first_actions`.
+    """
+    if not 0 <= sweep_seed < MAX_SWEEP_SEED:
+        raise ValueError(f"Expected 0 <= sweep_seed < {MAX_SWEEP_SEED} but got sweep_seed={sweep_seed}")
+    return [int(np.random.SeedSequence(sweep_seed, spawn_key=(k,)).generate_state(1, dtype=np.uint64)[0] >> 1)
+            for k in range(first, first + number_of_games)]
+
+
+# Example usage, the same games come out of a sweep no matter how it is split up:
+if __name__ == "__main__":
+    sweep_seed = new_sweep_seed()
+    seeds = game_seeds(sweep_seed, 10)
+    print(f"Sweep seed {sweep_seed}: {seeds}")
+    print("Split in two:", game_seeds(sweep_seed, 5) + game_seeds(sweep_seed, 5, first=5) == seeds)
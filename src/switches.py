@@ -0,0 +1,87 @@
+""" Compact storage of fictitious play trajectories as the iterations at which the players switch actions. """
+
+import numpy as np
+import pandas as pd
+
+# In plain fictitious play the empirical mixed strategy of a player after iteration i is the number of times they
+# played their first action in iterations 0..i divided by i + 1, so a trajectory is fully determined by the first
+# action and the iterations at which the player switches to the other action. Best responses come in long runs of the
+# same action, a game of a million iterations switches no more than a few thousand times.
+#
+# A game is stored as one row with the columns of `Play.simulate_trajectory` that are the same on every iteration
+# (`game_id`, `game`, `seed`, `max_iteration`, `epsilon`, `window_size`, `status`, `mode`) and
+#   recorded_iterations:                       the number of iterations of the trajectory
+#   rowena_first_action, colin_first_action:   the actions (0 or 1) played in iteration 0
+#   rowena_switches, colin_switches:           the iterations at which the player plays another action than in
+#                                              the iteration before, in increasing order
+#   rowena_probability, colin_probability:     the empirical mixed strategies after the last recorded iteration
+# A saddle point is stored as one iteration in which the saddle point's actions are played, which reproduces the
+# single iteration holding the limit in the trajectory format.
+
+# The columns of a trajectory (see `Play.simulate_trajectory`) that `expand_switches` can rebuild
+TRAJECTORY_COLUMNS = ["iteration", "game_id", "game", "seed", "max_iteration", "epsilon", "window_size",
+                      "rowena_probabilities", "colin_probabilities", "status", "mode"]
+
+
+def reconstruct_probabilities(first_actions, switches, lengths):
+    """
+    The empirical mixed strategies of one player in several games, concatenated game after game.
+
+        `first_actions` holds the action of every game's first iteration, `switches` the arrays of the iterations at
+        which the player switches, and `lengths` the number of iterations of every game. Runs as a handful of
+        vectorized passes over all iterations of all games, giving the same floating point values as the play.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    starts = np.cumsum(lengths) - lengths
+    local_iterations = np.arange(lengths.sum()) - np.repeat(starts, lengths)
+
+    # Mark every switch, the running number of switches within a game then tells which action is played
+    toggles = np.zeros(lengths.sum(), dtype=np.int64)
+    switch_counts = np.array([len(game_switches) for game_switches in switches], dtype=np.int64)
+    if switch_counts.sum():
+        toggles[np.repeat(starts, switch_counts) + np.concatenate([np.asarray(s, dtype=np.int64) for s in switches])] = 1
+    actions = np.repeat(np.asarray(first_actions, dtype=np.int64), lengths) ^ (_cumsum_per_game(toggles, starts, lengths) & 1)
+
+    # Counter of the first action, divided by the number of plays as in `BatchPlay._play`
+    counts = _cumsum_per_game((actions == 0).astype(np.int64), starts, lengths)
+    return counts / (local_iterations + 1.0)
+
+
+def _cumsum_per_game(values, starts, lengths):
+    # Cumulative sums that restart at the first iteration of every game
+    total = np.cumsum(values)
+    before = total[starts] - values[starts]
+    return total - np.repeat(before, lengths)
+
+
+def expand_switches(df, columns=None):
+    """
+    Rebuild the trajectories (one row per iteration, see `Play.simulate_trajectory`) of games stored as switches.
+
+        Only the requested `columns` (by default `TRAJECTORY_COLUMNS`) are built, the `game` column in particular is
+        expensive and best left out when it is not needed. Other columns of `df`, e.g. the `sweep_id`, are repeated
+        on every iteration of their game.
+    """
+    columns = columns or TRAJECTORY_COLUMNS
+    lengths = df["recorded_iterations"].to_numpy(np.int64)
+    expanded = {}
+    for column in columns:
+        if column == "iteration":
+            expanded[column] = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        elif column in ("rowena_probabilities", "colin_probabilities"):
+            player = column.split("_")[0]
+            expanded[column] = reconstruct_probabilities(df[f"{player}_first_action"].to_numpy(),
+                                                         df[f"{player}_switches"].tolist(), lengths)
+        elif column == "game":
+            expanded[column] = [game for game, length in zip(df["game"].tolist(), lengths) for _ in range(length)]
+        elif column in df.columns:
+            expanded[column] = np.repeat(df[column].to_numpy(), lengths)
+    return pd.DataFrame(expanded, columns=[column for column in columns if column in expanded])
+
+
+# Example usage, a game of 10 iterations where Rowena starts with her second action and switches at iterations 3 and 7:
+if __name__ == "__main__":
+    game = pd.DataFrame({"game_id": [0], "recorded_iterations": [10],
+                         "rowena_first_action": [1], "rowena_switches": [[3, 7]],
+                         "colin_first_action": [0], "colin_switches": [[]]})
+    print(expand_switches(game, columns=["iteration", "rowena_probabilities", "colin_probabilities"]))